@@ -0,0 +1,183 @@
+"""Several runners crawling the local mock sites together through a job table.
+
+Starts benchmarks.mock_server, then --runners processes running src.main.main
+against one database that also holds the job table, as runners on separate
+machines would against a shared one. With --kill-after one runner is killed
+(SIGKILL) partway, so its leased jobs are only retried once their lease
+expires. It checks that every article was stored, that no job was left
+behind, and how many article fetches were repeated. Run from the repository
+root:
+
+    python -m benchmarks.cooperative_crawl --runners 3 --kill-after 3
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+
+from loguru import logger
+
+from src.main import main as crawl
+from src.orchestrator import SCRAPERS
+
+from .mock_server import MockNewsServer, add_server_arguments, serve, server_options
+
+RUN = "cooperative-crawl"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_server_arguments(parser)
+    parser.add_argument("--runners", type=int, default=3, help="runner processes")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--section-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--rate", type=float, default=50.0, help="initial requests per second per host"
+    )
+    parser.add_argument(
+        "--max-rate", type=float, default=200.0, help="ceiling of the adaptive rate"
+    )
+    parser.add_argument(
+        "--lease-seconds", type=float, default=5.0, help="job lease duration"
+    )
+    parser.add_argument(
+        "--kill-after",
+        type=float,
+        metavar="SECONDS",
+        help="kill the first runner after SECONDS",
+    )
+    parser.add_argument(
+        "--output", metavar="PATH", help="also write the results to PATH as JSON"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="keep the runners' info logging"
+    )
+    return parser.parse_args()
+
+
+def run_runner(verbose, options):
+    if not verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+    asyncio.run(crawl(**options))
+
+
+def job_summary(database_path):
+    with sqlite3.connect(database_path) as conn:
+        articles = conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        jobs = {}
+        for kind, status, count in conn.execute(
+            "SELECT kind, status, COUNT(*) FROM crawl_jobs WHERE run = ? "
+            "GROUP BY kind, status",
+            (RUN,),
+        ):
+            jobs.setdefault(kind, {})[status] = count
+        fetches, retried = conn.execute(
+            "SELECT SUM(attempts), SUM(attempts > 1) FROM crawl_jobs "
+            "WHERE run = ? AND kind = 'article'",
+            (RUN,),
+        ).fetchone()
+        # Runners are named host:pid:suffix
+        by_runner = dict(
+            conn.execute(
+                "SELECT owner, COUNT(*) FROM crawl_jobs WHERE run = ? "
+                "AND status = 'done' GROUP BY owner ORDER BY owner",
+                (RUN,),
+            )
+        )
+    return articles, jobs, fetches or 0, retried or 0, by_runner
+
+
+def run(args):
+    options = server_options(args)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve, kwargs={"ready": ready, **options}, daemon=True
+    )
+    server.start()
+    if not ready.wait(10):
+        server.terminate()
+        raise RuntimeError("mock server did not start")
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "cooperative.db")
+        crawl_options = {
+            "base_urls": MockNewsServer(**options).base_urls(),
+            "database_path": database_path,
+            "job_table": database_path,
+            "job_run": RUN,
+            "lease_seconds": args.lease_seconds,
+            "incremental": False,
+            "max_in_flight": args.max_in_flight,
+            "section_concurrency": args.section_concurrency,
+            "requests_per_second": args.rate,
+            "max_requests_per_second": args.max_rate,
+        }
+        runners = [
+            context.Process(
+                target=run_runner,
+                args=(args.verbose, crawl_options),
+                name=f"runner-{i}",
+            )
+            for i in range(args.runners)
+        ]
+        started = time.perf_counter()
+        try:
+            for runner in runners:
+                runner.start()
+            if args.kill_after is not None:
+                time.sleep(args.kill_after)
+                os.kill(runners[0].pid, signal.SIGKILL)
+            for runner in runners:
+                runner.join()
+        finally:
+            elapsed = time.perf_counter() - started
+            for runner in runners:
+                if runner.is_alive():
+                    runner.kill()
+            server.terminate()
+            server.join()
+
+        articles, jobs, fetches, retried, by_runner = job_summary(database_path)
+
+    expected = (
+        sum(len(scraper.default_start_urls) for scraper in SCRAPERS.values())
+        * args.pages
+        * args.articles_per_page
+    )
+    left = sum(
+        counts.get(status, 0)
+        for counts in jobs.values()
+        for status in ("pending", "leased")
+    )
+    return {
+        "ok": articles == expected and left == 0,
+        "articles": articles,
+        "expected_articles": expected,
+        "jobs": jobs,
+        "jobs_left": left,
+        "article_fetches": fetches,
+        "article_jobs_retried": retried,
+        "done_jobs_by_runner": by_runner,
+        "exit_codes": [runner.exitcode for runner in runners],
+        "seconds": round(elapsed, 3),
+        "options": {**vars(args), "ports": list(args.ports)},
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(0 if results["ok"] else 1)
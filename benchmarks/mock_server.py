@@ -0,0 +1,417 @@
+"""Local stand-in for the scraped news sites, serving pages built from fixtures.
+
+Each site listens on its own port and serves listing pages, article pages and,
+for Expresso das Ilhas, the api/lists/section endpoint, with configurable
+latency and error injection. Content is generated deterministically from the
+URL, so every run of a benchmark sees the same archive.
+
+Run on its own with ``python -m benchmarks.mock_server`` to point a scraper at
+it by hand.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from string import Template
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+MONTHS = (
+    "Janeiro",
+    "Fevereiro",
+    "Março",
+    "Abril",
+    "Maio",
+    "Junho",
+    "Julho",
+    "Agosto",
+    "Setembro",
+    "Outubro",
+    "Novembro",
+    "Dezembro",
+)
+
+WORDS = (
+    "governo câmara municipal praia mindelo ilha santiago são vicente sal boa "
+    "vista fogo brava maio santo antão nicolau cabo verde ministro presidente "
+    "assembleia nacional eleições partido desenvolvimento turismo economia "
+    "crescimento investimento educação saúde hospital escola jovens mulheres "
+    "diáspora emigrantes cultura música morna festival desporto futebol "
+    "seleção tubarões azuis inflação orçamento estado empresas emprego "
+    "agricultura pesca água energia renovável transportes aéreos marítimos "
+    "segundo disse afirmou explicou durante semana passada próximo ano país"
+).split()
+
+SITES = ("anacao", "santiagomagazine", "expressodasilhas")
+
+
+def _template(source, name):
+    return Template((FIXTURES / source / name).read_text(encoding="utf-8"))
+
+
+def _rng(*parts):
+    seed = hashlib.blake2b("/".join(map(str, parts)).encode(), digest_size=8)
+    return random.Random(int.from_bytes(seed.digest(), "big"))
+
+
+def _sentence(rng, words):
+    sentence = " ".join(rng.choice(WORDS) for _ in range(words))
+    return sentence[0].upper() + sentence[1:] + "."
+
+
+class MockNewsSite:
+    """Pages of one site: `pages` listing pages per section, each with
+    `articles_per_page` articles of `paragraphs` paragraphs."""
+
+    def __init__(self, source, pages=5, articles_per_page=10, paragraphs=8):
+        self.source = source
+        self.pages = pages
+        self.articles_per_page = articles_per_page
+        self.paragraphs = paragraphs
+        self.templates = {
+            path.name: _template(source, path.name)
+            for path in (FIXTURES / source).iterdir()
+        }
+        self.base = ""
+
+    def article(self, section, page, index):
+        rng = _rng(self.source, section, page, index)
+        # Newest first: later pages hold older articles
+        published = datetime(2024, 6, 30, 18, 0) - timedelta(
+            hours=(page - 1) * self.articles_per_page + index
+        )
+        slug = f"{section}-{page}-{index}"
+        return {
+            "section": section,
+            "section_title": section.replace("-", " ").title(),
+            "slug": slug,
+            "article_slug": slug,
+            "title": _sentence(rng, 8)[:-1],
+            "summary": _sentence(rng, 20),
+            "author": rng.choice(
+                ("Redacção", "Inforpress", "Ana Fortes", "José Lopes")
+            ),
+            "published": published,
+            "iso_date": published.isoformat(),
+            "paragraphs": "\n".join(
+                f"<p>{' '.join(_sentence(rng, 14) for _ in range(4))}</p>"
+                for _ in range(self.paragraphs)
+            ),
+            "quote": _sentence(rng, 12),
+        }
+
+    def page_articles(self, section, page):
+        return [self.article(section, page, i) for i in range(self.articles_per_page)]
+
+    def render(self, name, **values):
+        return self.templates[name].safe_substitute(base=self.base, **values)
+
+    def handle(self, method, target, form):
+        """Return (status, content_type, body) for a request."""
+        return getattr(self, f"handle_{self.source}")(method, target, form)
+
+    # anacao.cv: /categoria/<section>/[page/<n>/], articles at /<slug>/
+    def handle_anacao(self, method, target, form):
+        path = urlsplit(target).path
+        match = re.fullmatch(r"/categoria/([\w-]+)/(?:page/(\d+)/)?", path)
+        if match:
+            section, page = match.group(1), int(match.group(2) or 1)
+            if page > self.pages:
+                return 404, "text/html", "<h1>Página não encontrada</h1>"
+            return 200, "text/html", self.anacao_listing(section, page)
+
+        match = re.fullmatch(r"/([\w-]+)-(\d+)-(\d+)/", path)
+        if match:
+            article = self.article(
+                match.group(1), int(match.group(2)), int(match.group(3))
+            )
+            published = article["published"]
+            date = (
+                f"{published.day} de {MONTHS[published.month - 1]} de {published.year}"
+            )
+            return 200, "text/html", self.render("article.html", **article, date=date)
+        return 404, "text/html", "<h1>Página não encontrada</h1>"
+
+    def anacao_listing(self, section, page):
+        link = lambda a: f"{self.base}/{a['slug']}/"  # noqa: E731
+        # The same featured stories head every page of a section
+        featured = "\n".join(
+            self.render("featured_item.html", **a, link=link(a))
+            for a in self.page_articles(section, 1)[:3]
+        )
+        items = "\n".join(
+            self.render("listing_item.html", **a, link=link(a))
+            for a in self.page_articles(section, page)
+        )
+        pagination = ""
+        if page < self.pages:
+            numbers = "".join(
+                f'<a class="inactive" href="{self.base}/categoria/{section}/page/{n}/">{n}</a>'
+                for n in range(1, self.pages + 1)
+                if n != page
+            )
+            pagination = (
+                f'<div class="pagination"><span class="current">{page}</span>{numbers}'
+                f'<a href="{self.base}/categoria/{section}/page/{page + 1}/">Seguinte ›</a>'
+                f'<a href="{self.base}/categoria/{section}/page/{self.pages}/">Última »</a></div>'
+            )
+        return self.render(
+            "listing.html",
+            section_title=section.title(),
+            featured=featured,
+            items=items,
+            pagination=pagination,
+        )
+
+    # santiagomagazine.cv: /<section>[?page=<n>], articles at /<section>/<slug>
+    def handle_santiagomagazine(self, method, target, form):
+        parts = urlsplit(target)
+        match = re.fullmatch(r"/([\w-]+)", parts.path)
+        if match:
+            section = match.group(1)
+            page = int(parse_qs(parts.query).get("page", ["1"])[0])
+            return 200, "text/html", self.santiagomagazine_listing(section, page)
+
+        match = re.fullmatch(r"/([\w-]+)/([\w-]+)-(\d+)-(\d+)", parts.path)
+        if match:
+            article = self.article(
+                match.group(1), int(match.group(3)), int(match.group(4))
+            )
+            date = article["published"].strftime("%d/%m/%Y %H:%M")
+            return 200, "text/html", self.render("article.html", **article, date=date)
+        return 404, "text/html", "<h1>404</h1>"
+
+    def santiagomagazine_listing(self, section, page):
+        items = "\n".join(
+            self.render(
+                "listing_item.html",
+                **a,
+                path=f"/{section}/{a['slug']}",
+                date=a["published"].strftime("%d/%m/%Y"),
+            )
+            for a in self.page_articles(section, min(page, self.pages))
+        )
+        pagination = "".join(
+            f'<li class="page-item{" active" if n == page else ""}">'
+            f'<a class="page-link" href="/{section}?page={n}">{n}</a></li>'
+            for n in range(1, self.pages + 1)
+        )
+        return self.render(
+            "listing.html",
+            section_title=section.title(),
+            items=items,
+            pagination=pagination,
+        )
+
+    # expressodasilhas.cv: /<section> then POST api/lists/section for older batches
+    def handle_expressodasilhas(self, method, target, form):
+        path = urlsplit(target).path
+        if method == "POST" and path == "/api/lists/section":
+            section = form.get("slug", [""])[0]
+            page = int(form.get("before", ["p2"])[0].lstrip("p") or 2)
+            return 200, "application/json", self.expressodasilhas_batch(section, page)
+
+        match = re.fullmatch(r"/([\w-]+)", path)
+        if match:
+            section = match.group(1)
+            items = "\n".join(
+                self.render("listing_item.html", **a, path=f"/{section}/{a['slug']}")
+                for a in self.page_articles(section, 1)
+            )
+            last = "p2" if self.pages > 1 else ""
+            return (
+                200,
+                "text/html",
+                self.render(
+                    "listing.html",
+                    section_title=section.title(),
+                    items=items,
+                    last=last,
+                ),
+            )
+
+        match = re.fullmatch(r"/([\w-]+)/([\w-]+)-(\d+)-(\d+)", path)
+        if match:
+            article = self.article(
+                match.group(1), int(match.group(3)), int(match.group(4))
+            )
+            published = article["published"]
+            date = (
+                f"{published.day} {MONTHS[published.month - 1][:3]} "
+                f"{published.year}, {published:%H:%M}"
+            )
+            return 200, "text/html", self.render("article.html", **article, date=date)
+        return 404, "text/html", "<h1>404</h1>"
+
+    def expressodasilhas_batch(self, section, page):
+        items = []
+        for a in self.page_articles(section, min(page, self.pages)):
+            escaped = {k: json.dumps(str(v))[1:-1] for k, v in a.items()}
+            items.append(json.loads(self.render("section_item.json", **escaped)))
+        payload = {"list": items}
+        if page < self.pages:
+            payload["last"] = f"p{page + 1}"
+        return json.dumps(payload)
+
+
+class MockNewsServer:
+    """Serves every site on its own port, with latency and error injection.
+
+    Each response is delayed by latency ± jitter seconds, and a share
+    error_rate of requests is answered with a 503.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        ports=(8801, 8802, 8803),
+        latency=0.05,
+        jitter=0.02,
+        error_rate=0.0,
+        **site_options,
+    ):
+        self.host = host
+        self.sites = {
+            port: MockNewsSite(source, **site_options)
+            for source, port in zip(SITES, ports)
+        }
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(0)
+
+    def base_urls(self):
+        return {
+            site.source: f"http://{self.host}:{port}"
+            for port, site in self.sites.items()
+        }
+
+    async def serve_forever(self, ready=None):
+        servers = []
+        for port, site in self.sites.items():
+            site.base = f"http://{self.host}:{port}"
+            servers.append(
+                await asyncio.start_server(
+                    lambda r, w, site=site: self.handle(site, r, w), self.host, port
+                )
+            )
+        if ready is not None:
+            ready.set()
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+    async def handle(self, site, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = b""
+                if "content-length" in headers:
+                    body = await reader.readexactly(int(headers["content-length"]))
+                form = parse_qs(body.decode()) if body else {}
+
+                delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+                await asyncio.sleep(max(delay, 0))
+
+                if self.rng.random() < self.error_rate:
+                    status, content_type, content = 503, "text/plain", "unavailable"
+                else:
+                    status, content_type, content = site.handle(method, target, form)
+                payload = content.encode()
+
+                etag = '"' + hashlib.blake2b(payload, digest_size=8).hexdigest() + '"'
+                if status == 200 and headers.get("if-none-match") == etag:
+                    status, payload = 304, b""
+
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                        f"Content-Type: {content_type}; charset=utf-8\r\n"
+                        f"Content-Length: {len(payload)}\r\n"
+                        f"ETag: {etag}\r\n"
+                        "Connection: keep-alive\r\n\r\n"
+                    ).encode()
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve(ready=None, **options):
+    """Entry point for running the server in a child process."""
+    server = MockNewsServer(**options)
+
+    async def run():
+        started = asyncio.Event()
+        task = asyncio.create_task(server.serve_forever(started))
+        await started.wait()
+        if ready is not None:
+            ready.set()
+        await task
+
+    asyncio.run(run())
+
+
+def add_server_arguments(parser):
+    parser.add_argument(
+        "--pages", type=int, default=5, help="listing pages per section"
+    )
+    parser.add_argument(
+        "--articles-per-page", type=int, default=10, help="articles per listing page"
+    )
+    parser.add_argument(
+        "--latency-ms", type=float, default=50, help="mean response latency"
+    )
+    parser.add_argument(
+        "--jitter-ms", type=float, default=20, help="latency spread around the mean"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of requests answered 503"
+    )
+    parser.add_argument(
+        "--ports",
+        type=int,
+        nargs=3,
+        default=(8801, 8802, 8803),
+        metavar=("ANACAO", "SANTIAGO", "EXPRESSO"),
+        help="ports of the three stand-in sites",
+    )
+
+
+def server_options(args):
+    return {
+        "ports": tuple(args.ports),
+        "latency": args.latency_ms / 1000,
+        "jitter": args.jitter_ms / 1000,
+        "error_rate": args.error_rate,
+        "pages": args.pages,
+        "articles_per_page": args.articles_per_page,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    options = server_options(args)
+    print(json.dumps(MockNewsServer(**options).base_urls(), indent=2))
+    serve(**options)
@@ -0,0 +1,205 @@
+"""Offline benchmark of a full crawl against the local mock sites.
+
+Starts benchmarks.mock_server in a child process, runs src.main.main against
+it with a fresh database and reports articles/sec, request latency p50/p99,
+CPU time and peak RSS. With --interrupt-after the crawl is stopped partway
+and resumed from its checkpoints, and each phase is timed. Run from the
+repository root:
+
+    python -m benchmarks.run_benchmark --pages 10 --parse-executor process
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import signal
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from loguru import logger
+
+from src.main import main as crawl
+from src.metrics import REQUEST_SECONDS
+
+from .mock_server import MockNewsServer, add_server_arguments, serve, server_options
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_server_arguments(parser)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--section-concurrency", type=int, default=4)
+    parser.add_argument("--parse-executor", choices=("thread", "process"))
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument(
+        "--shards", type=int, default=1, help="crawler processes sharing the sections"
+    )
+    parser.add_argument(
+        "--url-index", choices=("set", "hashed", "bloom"), default="set"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=4.0, help="initial requests per second per host"
+    )
+    parser.add_argument(
+        "--max-rate", type=float, default=20.0, help="ceiling of the adaptive rate"
+    )
+    parser.add_argument(
+        "--interrupt-after",
+        type=float,
+        metavar="SECONDS",
+        help="interrupt the crawl after SECONDS, then resume it from its checkpoints",
+    )
+    parser.add_argument(
+        "--output", metavar="PATH", help="also write the results to PATH as JSON"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="keep the scrapers' info logging"
+    )
+    return parser.parse_args()
+
+
+def record_latencies():
+    """Keep every request duration, for exact percentiles instead of buckets."""
+    samples = []
+    observe = REQUEST_SECONDS.observe
+
+    def observe_and_record(value, **labels):
+        samples.append(value)
+        observe(value, **labels)
+
+    REQUEST_SECONDS.observe = observe_and_record
+    return samples
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+def cpu_seconds():
+    # Children covers the parse pool's workers once they have exited
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (
+        self_usage.ru_utime
+        + self_usage.ru_stime
+        + children.ru_utime
+        + children.ru_stime
+    )
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "children": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1
+        ),
+    }
+
+
+def timed_crawl(samples, **options):
+    requests = len(samples)
+    started = time.perf_counter()
+    asyncio.run(crawl(**options))
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "requests": len(samples) - requests,
+    }
+
+
+def run(args):
+    options = server_options(args)
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=serve, kwargs={"ready": ready, **options}, daemon=True
+    )
+    server.start()
+    if not ready.wait(10):
+        server.terminate()
+        raise RuntimeError("mock server did not start")
+
+    samples = record_latencies()
+    crawl_options = {
+        "base_urls": MockNewsServer(**options).base_urls(),
+        "incremental": False,
+        "max_in_flight": args.max_in_flight,
+        "section_concurrency": args.section_concurrency,
+        "parse_executor": args.parse_executor,
+        "parse_workers": args.parse_workers,
+        "shards": args.shards,
+        "url_index": args.url_index,
+        "requests_per_second": args.rate,
+        "max_requests_per_second": args.max_rate,
+    }
+    phases = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "benchmark.db")
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+        try:
+            if args.interrupt_after is not None:
+                # Stop the crawl as Ctrl-C would, then resume it from its
+                # checkpoints: the resumed phase shows what restarting costs
+                timer = threading.Timer(
+                    args.interrupt_after, os.kill, (os.getpid(), signal.SIGINT)
+                )
+                timer.start()
+                phases["interrupted"] = timed_crawl(
+                    samples, database_path=database_path, **crawl_options
+                )
+                timer.cancel()
+                phases["resumed"] = timed_crawl(
+                    samples, database_path=database_path, resume=True, **crawl_options
+                )
+            else:
+                timed_crawl(samples, database_path=database_path, **crawl_options)
+        finally:
+            elapsed = time.perf_counter() - started
+            cpu = cpu_seconds() - cpu_before
+            server.terminate()
+            server.join()
+
+        with sqlite3.connect(database_path) as conn:
+            by_source = dict(
+                conn.execute("SELECT source, COUNT(*) FROM articles GROUP BY source")
+            )
+
+    articles = sum(by_source.values())
+    return {
+        "articles": articles,
+        "articles_by_source": by_source,
+        "seconds": round(elapsed, 3),
+        "articles_per_second": round(articles / elapsed, 2),
+        "requests": len(samples),
+        "request_p50_ms": round(percentile(samples, 50) * 1000, 2) if samples else None,
+        "request_p99_ms": round(percentile(samples, 99) * 1000, 2) if samples else None,
+        **({"phases": phases} if phases else {}),
+        "cpu_seconds": round(cpu, 3),
+        "peak_rss_mb": peak_rss_mb(),
+        "options": {**vars(args), "ports": list(args.ports)},
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.verbose:
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING")
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,101 @@
+"""Startup cost of a crawl: importing src.main and building the scrapers.
+
+Each sample runs in a fresh interpreter, since imports are only paid once per
+process. It reports the median time to import src.main and to build the
+scrapers with their HTTP clients, the slowest top-level imports (from
+python -X importtime), and the wall time of the whole interpreter. Run from
+the repository root:
+
+    python -m benchmarks.startup --repeat 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Runs in the child interpreter; prints its timings as JSON
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+from src.orchestrator import Orchestrator
+scrapers = Orchestrator(database_path=":memory:").build_scrapers()
+clients = [scraper.create_client() for scraper in scrapers]
+built = time.perf_counter()
+async def close():
+    await asyncio.gather(*(client.aclose() for client in clients))
+asyncio.run(close())
+print(json.dumps({"import": imported - started, "init": built - imported}))
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters run")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports listed")
+    parser.add_argument(
+        "--output", metavar="PATH", help="also write the results to PATH as JSON"
+    )
+    return parser.parse_args()
+
+
+def probe(*flags):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", PROBE],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+    wall = time.perf_counter() - started
+    return json.loads(result.stdout.splitlines()[-1]), wall, result.stderr
+
+
+def slowest_imports(stderr, top):
+    """Milliseconds spent importing each top-level package (with everything
+    it imported first), from python -X importtime output."""
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        package = name.strip()
+        # Submodules are counted in their package
+        if not cumulative.strip().isdigit() or "." in package:
+            continue
+        imports[package] = max(imports.get(package, 0), int(cumulative))
+    slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)
+    return {package: round(us / 1000, 1) for package, us in slowest[:top]}
+
+
+def run(args):
+    imports, inits, walls = [], [], []
+    for _ in range(args.repeat):
+        timings, wall, _ = probe()
+        imports.append(timings["import"])
+        inits.append(timings["init"])
+        walls.append(wall)
+    _, _, stderr = probe("-X", "importtime")
+
+    return {
+        "import_ms": round(statistics.median(imports) * 1000, 1),
+        "init_ms": round(statistics.median(inits) * 1000, 1),
+        "interpreter_ms": round(statistics.median(walls) * 1000, 1),
+        "slowest_imports_ms": slowest_imports(stderr, args.top),
+        "options": vars(args),
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,136 +1,747 @@
 import asyncio
+import os
 import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
 
-from fake_useragent import UserAgent
-from httpx import AsyncClient, HTTPStatusError, RequestError
+import aiosqlite
+from httpx import (
+    AsyncClient,
+    AsyncHTTPTransport,
+    HTTPStatusError,
+    Limits,
+    RequestError,
+)
 
+from .date_parser import date_parse_stats, record_worker_stats
+from .dedup import fingerprint
+from .http_cache import HttpCache
+from .http_client import ConnectionStats, ssl_context
+from .metrics import (
+    DEDUP_HITS,
+    PARSE_ERRORS,
+    PARSE_SECONDS,
+    REQUEST_SECONDS,
+    RESPONSE_BYTES,
+)
+from .proxy_pool import PROXY_FAILURE_STATUSES
+from .rate_limiter import (
+    RETRY_STATUSES,
+    HostRateLimiter,
+    backoff_delay,
+    parse_retry_after,
+    retry_budget,
+)
 from .scraper_logger import ScraperLogger
+from .url_index import BloomFilter, HashedUrlSet
+from .user_agents import user_agents
 
-SENTINEL = "STOP"
+
+def parse_and_fingerprint(article_parser, page_url, text):
+    """Parse an article and fingerprint its body for duplicate detection, so
+    both run in the parse executor."""
+    item = article_parser(page_url, text)
+    item["fingerprint"] = fingerprint(item["text_html"])
+    return item
+
+
+def parse_in_worker(func, *args):
+    """Run func in a parse worker process. Date parsing counters are kept per
+    process, so the worker's are sent back along with the result."""
+    return func(*args), os.getpid(), date_parse_stats()
 
 
 class BaseScraper:
-    def __init__(self, base_url, start_urls, storage_queue, database_path):
+    source = None
+    default_base_url = None
+    default_start_urls = ()
+    # Pure function (page_url, text) -> item dict. It must be defined at module
+    # level so it can be sent to a process pool.
+    article_parser = None
+
+    def __init__(
+        self,
+        base_url,
+        start_urls,
+        storage_queue,
+        database_path,
+        max_in_flight=8,
+        incremental=True,
+        max_seen_pages=2,
+        url_index="set",
+        section_concurrency=4,
+        parse_executor=None,
+        parse_workers=None,
+        max_connections=20,
+        max_keepalive_connections=10,
+        keepalive_expiry=30.0,
+        http2=False,
+        http_cache=None,
+        cache_ttl=7 * 24 * 3600,
+        cache_max_bytes=512 * 1024 * 1024,
+        requests_per_second=4.0,
+        max_requests_per_second=20.0,
+        retry_budget=retry_budget,
+        proxy_pool=None,
+        resume=False,
+        fingerprint_bodies=False,
+        page_archive=None,
+        job_table=None,
+    ):
         self.base_url = base_url
         self.start_urls = start_urls
         self.storage_queue = storage_queue
         self.database_path = database_path
-        self.user_agent = UserAgent()
-        self.user_agents = [
-            self.user_agent.chrome,
-            self.user_agent.firefox,
-            self.user_agent.edge,
-        ]
-        self.proxies = {
-            "http://": "http://18.230.20.205:3128",
-            "http://": "http://139.59.1.14:8080",
-            "http://": "http://8.219.43.134:8118",
-            "http://": "http://162.223.94.164:80",
-            "http://": "http://54.38.181.125:80",
-            "http://": "http://162.223.94.163:80",
-            "http://": "http://193.15.14.198:80",
-            "http://": "http://8.219.169.172:3132",
-            "http://": "http://139.162.78.109:3128",
-            "http://": "http://20.210.113.32:80",
-            "http://": "http://20.24.43.214:80",
-            "http://": "http://20.206.106.192:80",
-            "http://": "http://47.56.110.204:8989",
-            "http://": "http://162.248.225.130:80",
-            "http://": "http://162.248.225.11:80",
-            "http://": "http://198.199.86.11:3128",
-            "http://": "http://52.117.157.155:8002",
-            "http://": "http://162.223.116.54:80",
-            "http://": "http://162.248.225.198:80",
-            "http://": "http://103.83.179.180:3125",
-            "http://": "http://114.231.46.31:8089",
-            "http://": "http://202.12.80.6:82",
-            "http://": "http://202.12.80.8:82",
-            "http://": "http://119.2.52.152:8282",
-            "http://": "http://45.174.248.19:999",
-            "http://": "http://79.110.197.144:8081",
-            "http://": "http://183.230.162.122:9091",
-            "http://": "http://181.209.111.146:999",
-            "http://": "http://114.103.88.224:8089",
-            "http://": "http://185.194.11.180:8080",
-            "http://": "http://111.72.198.123:8089",
-            "http://": "http://103.158.220.2:83",
-            "http://": "http://103.31.232.174:8080",
-            "http://": "http://186.125.218.147:999",
-            "http://": "http://114.231.46.237:8089",
-            "http://": "http://154.64.215.132:999",
-            "http://": "http://213.207.195.181:8080",
-            "http://": "http://154.73.29.201:8080",
-            "http://": "http://154.73.28.193:8080",
-            "http://": "http://95.142.223.24:56379",
-            "http://": "http://193.239.58.92:8081",
-            "http://": "http://102.214.106.86:1975",
-            "http://": "http://115.42.45.1:80",
-            "http://": "http://77.119.250.129:8080",
-        }
+        # URLs already stored or claimed during this run. "set" keeps full URL
+        # strings, "hashed" keeps 64-bit ids, and "bloom" keeps stored links in a
+        # Bloom filter confirmed against the unique link index on a hit, so only
+        # the URLs claimed by this run are held individually.
+        if url_index not in ("set", "hashed", "bloom"):
+            raise ValueError(f"Unknown url_index: {url_index}")
+        self.url_index = url_index
+        self.processed_urls = set() if url_index == "set" else HashedUrlSet()
+        self.stored_urls = None
+        self.conn = None
+        # Caps the number of article requests in flight for this site
+        self.max_in_flight = max_in_flight
+        self.fetch_semaphore = asyncio.Semaphore(max_in_flight)
+        # In incremental mode a section stops paginating after max_seen_pages
+        # consecutive listing pages that brought no new article
+        self.incremental = incremental
+        self.max_seen_pages = max_seen_pages
+        self.seen_page_streaks = {}
+        # Listing pages waiting to be parsed, as (page_url, section, cursor).
+        # Sections are crawled in parallel by section_concurrency workers, while
+        # each section only ever has its next page queued.
+        self.frontier = asyncio.Queue()
+        self.scheduled_pages = set()
+        # Set by stop(): pages in progress finish, but no new ones are queued
+        self.stopping = False
+        # Where each section goes on after the page being parsed, checkpointed
+        # once that page is done. With resume, sections restart from their
+        # checkpoint instead of their first page.
+        self.next_pages = {}
+        self.resume = resume
+        self.section_concurrency = section_concurrency
+        # Where article_parser runs: None parses on the event loop, "thread" or
+        # "process" start a pool of parse_workers for the run, and an Executor
+        # instance is used as is (and left running) so scrapers can share one
+        if parse_executor not in (None, "thread", "process") and not isinstance(
+            parse_executor, Executor
+        ):
+            raise ValueError(f"Unknown parse_executor: {parse_executor}")
+        self.parse_executor = parse_executor
+        self.parse_workers = parse_workers
+        self.fingerprint_bodies = fingerprint_bodies
+        self.executor = None
+        # One pooled client per run, shared by every request of this site, so
+        # max_connections also caps the connections opened to its host
+        self.limits = Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.client = None
+        self.connection_stats = ConnectionStats()
+        # On-disk HTTP cache: a path to open one for the run, or an HttpCache
+        # already opened and shared with other scrapers, used as is (and left
+        # open); None disables it
+        self.shared_http_cache = (
+            http_cache if isinstance(http_cache, HttpCache) else None
+        )
+        self.http_cache_path = http_cache if self.shared_http_cache is None else None
+        self.cache_ttl = cache_ttl
+        self.cache_max_bytes = cache_max_bytes
+        self.http_cache = None
+        # Per-host adaptive throttles, and the retry allowance shared by default
+        # with every other scraper in the process
+        self.requests_per_second = requests_per_second
+        self.max_requests_per_second = max_requests_per_second
+        self.rate_limiters = {}
+        self.retry_budget = retry_budget
+        # Requests rotate across the pool's proxies, each with its own pooled
+        # client; without a pool they go direct
+        self.proxy_pool = proxy_pool
+        self.proxy_clients = {}
+        # PageArchive that fetched article pages are written to, if any
+        self.page_archive = page_archive
+        # JobTable shared with other runners: listing pages and article fetches
+        # are claimed from it instead of the local frontier, so several
+        # runners crawl the site together
+        self.job_table = job_table
+        self.job_poll_interval = 1.0
+        self.job_stats = {"page": 0, "article": 0, "failed": 0, "lost": 0}
+        self.user_agents = user_agents()
+
+    async def fetch_page(self, client, page_url, max_retries=5, immutable=False):
+        """GET page_url, through the HTTP cache when one is configured.
+
+        Cached immutable pages (published articles) are returned without a
+        request; other cached pages are revalidated with a conditional GET.
+        """
+        cached = None
+        headers = {}
+        if self.http_cache is not None:
+            cached = await self.http_cache.get(page_url)
+            if cached is not None and immutable:
+                return await self.http_cache.hit(page_url, cached)
+            if cached is not None:
+                headers = self.http_cache.conditional_headers(cached)
+
+        resp = await self._request(
+            "GET", page_url, client, max_retries, headers=headers
+        )
+        if resp is None:
+            return None
+        if resp.status_code == 304 and cached is not None:
+            return await self.http_cache.hit(page_url, cached, revalidated=True)
+        if self.http_cache is not None:
+            await self.http_cache.store(page_url, resp)
+        if immutable and self.page_archive is not None:
+            await asyncio.to_thread(
+                self.page_archive.write, self.source, page_url, resp
+            )
+        return resp
 
-    async def fetch_page(self, client, page_url, max_retries=5):
+    async def _request(
+        self, method, url, client=None, max_retries=5, headers=None, data=None
+    ):
+        """Send a request through the host's rate limiter, retrying failed
+        connections and RETRY_STATUSES with backoff (or their Retry-After) while
+        the retry budget allows.
+
+        Returns the response, or None once the retries are exhausted. Other
+        error statuses raise HTTPStatusError; a 304 is returned when headers
+        make the request conditional.
+        """
+        limiter = self.rate_limiter(url)
+        self.retry_budget.deposit()
         retries = 0
 
-        while retries < max_retries:
-            headers = {"User-Agent": random.choice(self.user_agents)}
+        while True:
+            request_headers = {"User-Agent": random.choice(self.user_agents)}
+            request_headers.update(headers or {})
 
+            retry_after = None
+            request_client, proxy = self.pick_client(client or self.client)
+            await limiter.acquire()
+            started = time.monotonic()
             try:
-                resp = await client.get(page_url, headers=headers, timeout=180)
-                resp.raise_for_status()
+                resp = await request_client.request(
+                    method, url, headers=request_headers, data=data, timeout=180
+                )
+                self.record_response(resp, started)
+                self.report_proxy(
+                    proxy, resp.status_code not in PROXY_FAILURE_STATUSES, started
+                )
+                if not (resp.status_code == 304 and headers):
+                    resp.raise_for_status()
+                limiter.on_success(time.monotonic() - started)
                 return resp
             except HTTPStatusError as e:
-                if e.response.status_code == 502:
-                    retries += 1
-                    ScraperLogger.log_warning(
-                        f"{page_url} \n 502 Bad Gateway. Retrying... ({retries}/{max_retries})"
-                    )
-                    await asyncio.sleep(2**retries)  # Exponential backoff
-                else:
+                if e.response.status_code not in RETRY_STATUSES:
                     raise
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                reason = f"{e.response.status_code} {e.response.reason_phrase}"
             except RequestError as e:
-                retries += 1
-                ScraperLogger.log_warning(
-                    f"{page_url} \n  Request failed. Retrying... ({retries}/{max_retries})"
-                )
-                await asyncio.sleep(2**retries)  # Exponential backoff
+                self.record_response(None, started)
+                self.report_proxy(proxy, False)
+                reason = f"Request failed ({type(e).__name__})"
+            limiter.on_error(retry_after)
+
+            retries += 1
+            if retries >= max_retries:
+                break
+            if not self.retry_budget.withdraw():
+                ScraperLogger.log_warning(f"{url} \n Retry budget exhausted.")
+                break
+
+            delay = retry_after if retry_after is not None else backoff_delay(retries)
+            ScraperLogger.log_warning(
+                f"{url} \n {reason}. Retrying in {delay:.1f}s... ({retries}/{max_retries})"
+            )
+            await asyncio.sleep(delay)
 
         ScraperLogger.log_error(
-            f"Failed to fetch page {page_url} after {max_retries} retries."
+            f"Failed to {'fetch page' if method == 'GET' else method} {url} "
+            f"after {retries} attempts."
         )
+        return None
+
+    def rate_limiter(self, url):
+        """Return the adaptive rate limiter of url's host."""
+        host = urlsplit(url).netloc
+        if host not in self.rate_limiters:
+            self.rate_limiters[host] = HostRateLimiter(
+                rate=self.requests_per_second,
+                max_rate=self.max_requests_per_second,
+            )
+        limiter = self.rate_limiters[host]
+        if self.job_table is not None:
+            # The rates are for all the runners of the job table together
+            limiter.split(self.job_table.active_runners)
+        return limiter
 
     async def send_post_request(self, endpoint, data):
+        """POST data to endpoint, with the retries of fetch_page. Returns None
+        if the request failed."""
         url = f"{self.base_url}/{endpoint}"
+        try:
+            response = await self._request("POST", url, data=data)
+        except HTTPStatusError as e:
+            ScraperLogger.log_warning(
+                f"POST request to {url} failed with status code "
+                f"{e.response.status_code}. Response: {e.response.text}"
+            )
+            return None
+        if response is not None:
+            ScraperLogger.log_info(f"POST request to {url} successful!")
+        return response
 
-        async with AsyncClient(proxies=self.proxies) as client:
+    def record_response(self, response, started):
+        status = response.status_code if response is not None else "error"
+        REQUEST_SECONDS.observe(
+            time.monotonic() - started, source=self.source, status=status
+        )
+        if response is not None:
+            RESPONSE_BYTES.inc(len(response.content), source=self.source)
+
+    def pick_client(self, client):
+        """Return the client for the next request and the proxy it goes through."""
+        proxy = self.proxy_pool.choose() if self.proxy_pool is not None else None
+        if proxy is None:
+            return client, None
+
+        if proxy not in self.proxy_clients:
+            self.proxy_clients[proxy] = self.create_client(proxy)
+        return self.proxy_clients[proxy], proxy
+
+    def report_proxy(self, proxy, ok, started=None):
+        if proxy is not None:
+            latency = time.monotonic() - started if ok else None
+            self.proxy_pool.report(proxy, ok, latency)
+
+    def create_client(self, proxy=None):
+        """Build the pooled HTTP client for requests going through proxy, or direct."""
+        http2 = self.http2
+        if http2:
             try:
-                response = await client.post(url, data=data)
+                import h2  # noqa: F401
+            except ImportError:
+                ScraperLogger.log_warning(
+                    "HTTP/2 needs the h2 package (pip install httpx[http2]); "
+                    "falling back to HTTP/1.1"
+                )
+                http2 = False
 
-                # Check if the request was successful (status code 2xx)
-                if response.status_code // 100 == 2:
-                    ScraperLogger.log_info(f"POST request to {url} successful!")
-                    return response  # Return the response data
-                else:
-                    ScraperLogger.log_warning(
-                        f"POST request to {url} failed with status code {response.status_code}. Response: {response.text}"
-                    )
-                    return None
-            except RequestError as e:
+        mounts = None
+        if proxy is not None:
+            transport = AsyncHTTPTransport(
+                proxy=proxy, limits=self.limits, http2=http2, verify=ssl_context()
+            )
+            mounts = {"all://": transport}
+
+        return AsyncClient(
+            verify=ssl_context(),
+            limits=self.limits,
+            http2=http2,
+            mounts=mounts,
+            event_hooks={"request": [self.connection_stats.on_request]},
+        )
+
+    async def load_processed_urls(self):
+        """Load the links already stored for this source, once per run."""
+        try:
+            async with self.conn.execute(
+                "SELECT COUNT(*) FROM articles WHERE source = ?", (self.source,)
+            ) as cursor:
+                (count,) = await cursor.fetchone()
+
+            if self.url_index == "bloom":
+                self.stored_urls = BloomFilter(count)
+                urls = self.stored_urls
+            else:
+                urls = self.processed_urls
+
+            async with self.conn.execute(
+                "SELECT link FROM articles WHERE source = ?", (self.source,)
+            ) as cursor:
+                async for (link,) in cursor:
+                    urls.add(link)
+        except aiosqlite.OperationalError as e:
+            # The storage worker creates the table; a first run starts empty
+            ScraperLogger.log_warning(f"Could not load processed URLs: {e}")
+            return
+
+        ScraperLogger.log_info(f"Loaded {count} processed URLs for {self.source}")
+
+    async def link_stored(self, url):
+        async with self.conn.execute(
+            "SELECT 1 FROM articles WHERE link = ?", (url,)
+        ) as cursor:
+            return await cursor.fetchone() is not None
+
+    async def claim_url(self, url):
+        """Mark url as taken by this run; False if it was already processed."""
+        if url in self.processed_urls:
+            return False
+
+        if self.stored_urls is not None and url in self.stored_urls:
+            # Bloom filter hit: confirm against the database index
+            if await self.link_stored(url) or url in self.processed_urls:
+                return False
+
+        self.processed_urls.add(url)
+        return True
+
+    async def fetch_articles(self, client, urls):
+        """Fetch and parse article URLs concurrently, at most max_in_flight at a time.
+
+        URLs are claimed in processed_urls before any request is sent, so an article
+        listed twice (or on two pages being processed at once) is fetched only once.
+        Returns the number of URLs that were not seen before.
+
+        With a job table the articles are added to it as jobs instead, and only
+        those no runner had added yet count as new.
+        """
+        pending = []
+        for url in urls:
+            if not await self.claim_url(url):
+                DEDUP_HITS.inc(source=self.source)
+                ScraperLogger.log_info(f"Skipped existing URL: {url}")
+                continue
+            pending.append(url)
+
+        if self.job_table is not None:
+            return await self.job_table.add(
+                self.source, "article", [(url, None, None, 0) for url in pending]
+            )
+        await asyncio.gather(*(self.fetch_article(client, url) for url in pending))
+        return len(pending)
+
+    async def fetch_article(self, client, url):
+        """Fetch and parse an article; False if it could not be fetched."""
+        try:
+            async with self.fetch_semaphore:
+                resp = await self.fetch_page(client, url, immutable=True)
+            if resp is None:
+                # Release the claim so a later page can retry this article
+                self.processed_urls.discard(url)
+                return False
+            await self.parse_article(url, resp.text)
+            return True
+        except Exception as e:
+            self.processed_urls.discard(url)
+            ScraperLogger.log_error(f"Error fetching article {url}: {e}")
+            return False
+
+    def keep_paginating(self, section, new_urls):
+        """Record a listing page of section and tell whether to fetch the next one."""
+        if not self.incremental:
+            return True
+
+        if new_urls:
+            self.seen_page_streaks[section] = 0
+            return True
+
+        streak = self.seen_page_streaks.get(section, 0) + 1
+        self.seen_page_streaks[section] = streak
+        if streak >= self.max_seen_pages:
+            ScraperLogger.log_info(
+                f"Stopping {section} after {streak} listing pages with no new articles"
+            )
+            return False
+        return True
+
+    def schedule_page(self, page_url, section, cursor=None):
+        """Queue a listing page of section on the frontier.
+
+        cursor carries pagination state that is not part of the URL, such as a
+        "load more" token.
+        """
+        if (page_url, cursor) in self.scheduled_pages:
+            # Pagination pointing back at a page already crawled would loop
+            ScraperLogger.log_info(f"Skipped already scheduled page: {page_url}")
+            return
+        self.next_pages[section] = (page_url, cursor)
+        # With a job table, the page becomes a job once the current one is done
+        if self.stopping or self.job_table is not None:
+            return
+        self.scheduled_pages.add((page_url, cursor))
+        self.frontier.put_nowait((page_url, section, cursor))
+
+    def stop(self):
+        """Wind the crawl down: drop the queued listing pages and let the ones
+        being parsed finish, so their articles still reach the storage queue."""
+        self.stopping = True
+        while not self.frontier.empty():
+            self.frontier.get_nowait()
+            self.frontier.task_done()
+
+    async def crawl_frontier(self, client):
+        while True:
+            page_url, section, cursor = await self.frontier.get()
+            try:
+                await self.parse_page(client, page_url, section, cursor)
+                # The page's articles are queued by now, so the writer stores
+                # them no later than the checkpoint that moves past the page
+                await self.save_checkpoint(section, self.next_pages.pop(section, None))
+            except Exception as e:
+                # The section keeps its checkpoint at this page, to retry on resume
+                self.next_pages.pop(section, None)
                 ScraperLogger.log_error(
-                    f"An error occurred during the POST request to {url}: {e}"
+                    f"Error parsing page {page_url}"
+                    + (f" before {cursor}" if cursor is not None else "")
+                    + f": {e}"
                 )
-                return None
+            finally:
+                self.frontier.task_done()
+
+    async def crawl_jobs(self, client, kind):
+        """Claim and run the site's jobs of kind ("page" or "article") until
+        none is left. Article workers also wait for the listing pages still
+        being parsed, by any runner, as those add articles."""
+        kinds = ("page",) if kind == "page" else ("page", "article")
+        while not self.stopping:
+            job = await self.job_table.claim(self.source, kind)
+            if job is None:
+                if not await self.job_table.remaining(self.source, kinds):
+                    return
+                # The jobs left are leased, or waiting to be retried
+                await asyncio.sleep(self.job_poll_interval)
+                continue
+
+            try:
+                await self.run_job(client, job)
+            except Exception as e:
+                self.job_stats["failed"] += 1
+                ScraperLogger.log_error(f"Error running {kind} job {job['url']}: {e}")
+                kept = await self.job_table.fail(
+                    job["id"], str(e), backoff_delay(job["attempts"])
+                )
+            else:
+                self.job_stats[kind] += 1
+                if kind == "article":
+                    # Done once the writer has stored the article queued before
+                    await self.storage_queue.put(
+                        {
+                            "type": "job",
+                            "job_id": job["id"],
+                            "owner": self.job_table.owner,
+                        }
+                    )
+                    continue
+                kept = await self.job_table.complete(
+                    [(job["id"], self.job_table.owner)]
+                )
+
+            if not kept:
+                self.job_stats["lost"] += 1
+                ScraperLogger.log_warning(
+                    f"Lease on {job['url']} expired before the job was done; "
+                    "another runner may have run it too"
+                )
+
+    async def run_job(self, client, job):
+        if job["kind"] == "article":
+            if not await self.fetch_article(client, job["url"]):
+                raise RuntimeError("article could not be fetched")
+            return
+
+        section = job["section"]
+        self.seen_page_streaks[section] = job["seen_streak"]
+        try:
+            await self.parse_page(client, job["url"], section, job["cursor"])
+        finally:
+            next_page = self.next_pages.pop(section, None)
+        if next_page is not None:
+            # Added before the page is marked done, so that the section never
+            # looks finished to the other runners in between
+            page_url, cursor = next_page
+            streak = self.seen_page_streaks.get(section, 0)
+            await self.job_table.add(
+                self.source, "page", [(page_url, section, cursor, streak)]
+            )
 
-    async def parse_page(self, client, page_url):
+    async def save_checkpoint(self, section, next_page):
+        """Queue the checkpoint of section for the storage worker. A section
+        without a next page is done."""
+        page_url, cursor = next_page or (None, None)
+        await self.storage_queue.put(
+            {
+                "type": "checkpoint",
+                "source": self.source,
+                "section": section,
+                "page_url": page_url,
+                "cursor": cursor,
+                "done": next_page is None,
+            }
+        )
+
+    async def load_checkpoints(self):
+        """Checkpoints of this source by section, as (page_url, cursor, done)."""
+        try:
+            async with self.conn.execute(
+                "SELECT section, page_url, cursor, done FROM crawl_checkpoints "
+                "WHERE source = ?",
+                (self.source,),
+            ) as cursor:
+                return {
+                    section: (page_url, page_cursor, bool(done))
+                    for section, page_url, page_cursor, done in await cursor.fetchall()
+                }
+        except aiosqlite.OperationalError as e:
+            ScraperLogger.log_warning(f"Could not load checkpoints: {e}")
+            return {}
+
+    async def schedule_start_pages(self):
+        if self.job_table is not None:
+            # The run's job table takes the place of checkpoints: sections
+            # another runner already added are left as they are
+            added = await self.job_table.add(
+                self.source,
+                "page",
+                [
+                    (f"{self.base_url}{start_url}", start_url, None, 0)
+                    for start_url in self.start_urls
+                ],
+            )
+            ScraperLogger.log_info(
+                f"Added {added} of {len(self.start_urls)} sections of {self.source} "
+                f"to job run {self.job_table.run}"
+            )
+            return
+
+        checkpoints = await self.load_checkpoints() if self.resume else {}
+        for start_url in self.start_urls:
+            if start_url not in checkpoints:
+                page_url, cursor = f"{self.base_url}{start_url}", None
+                # Restart the section's checkpoint along with the section
+                await self.save_checkpoint(start_url, (page_url, cursor))
+                self.schedule_page(page_url, start_url)
+                continue
+
+            page_url, cursor, done = checkpoints[start_url]
+            if done:
+                ScraperLogger.log_info(f"Section {start_url} already crawled")
+            else:
+                ScraperLogger.log_info(f"Resuming {start_url} from {page_url}")
+                self.schedule_page(page_url, start_url, cursor)
+
+    async def parse_page(self, client, page_url, section, cursor=None):
         raise NotImplementedError("Subclasses must implement the parse_page method.")
 
-    async def parse_article(self, page_url, html):
-        raise NotImplementedError("Subclasses must implement the parse_article method.")
+    async def parse_article(self, page_url, text):
+        try:
+            with PARSE_SECONDS.time(source=self.source):
+                if self.fingerprint_bodies:
+                    item = await self.run_parse(
+                        parse_and_fingerprint, self.article_parser, page_url, text
+                    )
+                else:
+                    item = await self.run_parse(self.article_parser, page_url, text)
+        except Exception as e:
+            PARSE_ERRORS.inc(source=self.source)
+            ScraperLogger.log_error(f"Error parsing article {page_url}: {e}")
+            return
+
+        # Put the item into the storage queue
+        await self.storage_queue.put(item)
+
+    async def run_parse(self, func, *args):
+        if self.executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        if isinstance(self.executor, ProcessPoolExecutor):
+            result, pid, counters = await loop.run_in_executor(
+                self.executor, parse_in_worker, func, *args
+            )
+            record_worker_stats(pid, counters)
+            return result
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    def start_parse_executor(self):
+        if self.parse_executor == "process":
+            return ProcessPoolExecutor(max_workers=self.parse_workers)
+        if self.parse_executor == "thread":
+            return ThreadPoolExecutor(max_workers=self.parse_workers)
+        return self.parse_executor
 
     async def run(self):
-        async with AsyncClient(proxies=self.proxies) as client:
-            for start_url in self.start_urls:
-                full_url = f"{self.base_url}{start_url}"
-                await self.parse_page(client, full_url)
+        self.executor = self.start_parse_executor()
+        try:
+            await self.crawl()
+        finally:
+            if self.executor is not self.parse_executor:
+                self.executor.shutdown()
+            self.executor = None
 
-        # Signal the storage saver to exit
-        await self.storage_queue.put(SENTINEL)
+    async def crawl(self):
+        if self.shared_http_cache is not None:
+            self.http_cache = self.shared_http_cache
+        elif self.http_cache_path is not None:
+            self.http_cache = HttpCache(
+                self.http_cache_path, self.cache_ttl, self.cache_max_bytes
+            )
+            await self.http_cache.open()
+
+        try:
+            await self.crawl_site()
+        finally:
+            if self.http_cache is not None:
+                if self.http_cache is not self.shared_http_cache:
+                    await self.http_cache.close()
+                self.http_cache = None
+
+    async def crawl_site(self):
+        async with aiosqlite.connect(self.database_path) as conn:
+            self.conn = conn
+            await self.load_processed_urls()
+
+            async with self.create_client() as client:
+                self.client = client
+                await self.schedule_start_pages()
+
+                if self.job_table is None:
+                    workers = [
+                        asyncio.create_task(self.crawl_frontier(client))
+                        for _ in range(self.section_concurrency)
+                    ]
+                    finished = self.frontier.join()
+                else:
+                    workers = [
+                        asyncio.create_task(self.crawl_jobs(client, "page"))
+                        for _ in range(self.section_concurrency)
+                    ] + [
+                        asyncio.create_task(self.crawl_jobs(client, "article"))
+                        for _ in range(self.max_in_flight)
+                    ]
+                    finished = asyncio.gather(*workers)
+                try:
+                    await finished
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
+
+                    await asyncio.gather(
+                        *(
+                            proxy_client.aclose()
+                            for proxy_client in self.proxy_clients.values()
+                        )
+                    )
+                    self.proxy_clients = {}
+
+        self.client = None
+        self.conn = None
+        ScraperLogger.log_info(
+            f"Connections for {self.source}: {self.connection_stats.snapshot()}"
+        )
+        rates = {
+            host: round(limiter.rate, 2) for host, limiter in self.rate_limiters.items()
+        }
+        ScraperLogger.log_info(f"Request rates for {self.source}: {rates}")
+        if self.job_table is not None:
+            ScraperLogger.log_info(f"Jobs run for {self.source}: {self.job_stats}")
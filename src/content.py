@@ -0,0 +1,195 @@
+"""Compressed storage of article bodies.
+
+Bodies live in the article_content table, one row per article, apart from the
+metadata in articles. Each row names the codec it was written with: "zlib",
+"zstd", or "zstd:<id>" for zstd with the shared dictionary <id> from
+compression_dictionaries. zstd needs the optional zstandard package; without
+it bodies are written with zlib. Rows stay readable whatever codec is in use
+when they are read.
+
+Run ``python -m src.content --train-dictionary`` once enough articles are
+stored to train a dictionary from them; writers use the newest one.
+"""
+
+import argparse
+import json
+import sqlite3
+import zlib
+
+from .scraper_logger import ScraperLogger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# articles with their bodies, inline (rows stored before article_content) or
+# decompressed by article_body(), available once attach() has run
+ARTICLES_VIEW = """
+    CREATE TEMP VIEW IF NOT EXISTS articles_full AS
+    SELECT a.id, a.source, a.title, a.author, a.date_pub, a.link, a.topic,
+        COALESCE(a.text_html, article_body(c.codec, c.body)) AS text_html
+    FROM articles a
+    LEFT JOIN article_content c ON c.article_id = a.id
+"""
+
+
+class BodyCodec:
+    """Compresses and decompresses article bodies.
+
+    codec is "zstd" or "zlib"; None picks zstd when zstandard is installed.
+    dictionaries maps dictionary ids to their bytes, and the newest one is used
+    to compress.
+    """
+
+    def __init__(self, codec=None, dictionaries=None, level=None):
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "zlib"
+        if codec not in ("zstd", "zlib"):
+            raise ValueError(f"Unknown codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("The zstd codec needs the zstandard package")
+
+        self.codec = codec
+        self.level = level
+        self.dictionaries = {}
+        self.decompressors = {}
+        self.compressor = None
+        self.name = codec
+        for dictionary_id, data in sorted((dictionaries or {}).items()):
+            self.add_dictionary(dictionary_id, data)
+
+        if codec == "zstd" and self.compressor is None:
+            self.compressor = zstandard.ZstdCompressor(level=level or 3)
+
+    def add_dictionary(self, dictionary_id, data):
+        self.dictionaries[dictionary_id] = data
+        if self.codec == "zstd":
+            self.compressor = zstandard.ZstdCompressor(
+                level=self.level or 3,
+                dict_data=zstandard.ZstdCompressionDict(data),
+            )
+            self.name = f"zstd:{dictionary_id}"
+
+    def compress(self, text):
+        """Return (codec, blob) for a body."""
+        data = text.encode("utf-8")
+        if self.codec == "zlib":
+            return "zlib", zlib.compress(data, self.level or 6)
+        return self.name, self.compressor.compress(data)
+
+    def decompress(self, codec, blob):
+        if blob is None:
+            return None
+        if codec == "zlib":
+            return zlib.decompress(blob).decode("utf-8")
+
+        if zstandard is None:
+            raise RuntimeError(f"Reading {codec} bodies needs the zstandard package")
+        decompressor = self.decompressors.get(codec)
+        if decompressor is None:
+            if codec == "zstd":
+                decompressor = zstandard.ZstdDecompressor()
+            else:
+                data = self.dictionaries[int(codec.split(":", 1)[1])]
+                decompressor = zstandard.ZstdDecompressor(
+                    dict_data=zstandard.ZstdCompressionDict(data)
+                )
+            self.decompressors[codec] = decompressor
+        return decompressor.decompress(blob).decode("utf-8")
+
+
+def load_dictionaries(conn):
+    try:
+        return dict(conn.execute("SELECT id, data FROM compression_dictionaries"))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def attach(conn, codec=None):
+    """Make bodies readable in SQL on a sqlite3 connection: registers
+    article_body(codec, body) and the temporary articles_full view."""
+    body_codec = BodyCodec(codec, load_dictionaries(conn))
+    conn.create_function("article_body", 2, body_codec.decompress, deterministic=True)
+    conn.execute(ARTICLES_VIEW)
+    return body_codec
+
+
+async def attach_async(conn, codec=None):
+    """attach() for an aiosqlite connection."""
+    async with conn.execute("SELECT id, data FROM compression_dictionaries") as cursor:
+        dictionaries = dict(await cursor.fetchall())
+    body_codec = BodyCodec(codec, dictionaries)
+    await conn.create_function(
+        "article_body", 2, body_codec.decompress, deterministic=True
+    )
+    await conn.execute(ARTICLES_VIEW)
+    return body_codec
+
+
+def train_dictionary(conn, samples=2000, size=110 * 1024):
+    """Train a zstd dictionary on a sample of stored bodies and save it."""
+    if zstandard is None:
+        raise RuntimeError("Training a dictionary needs the zstandard package")
+
+    body_codec = attach(conn)
+    # Sample ids first, so only the sampled bodies are decompressed
+    ids = [
+        article_id
+        for (article_id,) in conn.execute(
+            "SELECT id FROM articles ORDER BY RANDOM() LIMIT ?", (samples,)
+        )
+    ]
+    bodies = [
+        text.encode("utf-8")
+        for (text,) in conn.execute(
+            "SELECT text_html FROM articles_full WHERE id IN "
+            "(SELECT value FROM json_each(?)) AND text_html IS NOT NULL",
+            (json.dumps(ids),),
+        )
+    ]
+    if len(bodies) < 100:
+        raise ValueError(f"Need at least 100 stored articles, found {len(bodies)}")
+
+    dictionary = zstandard.train_dictionary(size, bodies)
+    cursor = conn.execute(
+        "INSERT INTO compression_dictionaries (codec, data, created_at) "
+        "VALUES ('zstd', ?, datetime('now'))",
+        (dictionary.as_bytes(),),
+    )
+    conn.commit()
+
+    # Compare on the sample the dictionary was trained on
+    plain = sum(len(body_codec.compressor.compress(body)) for body in bodies)
+    body_codec.add_dictionary(cursor.lastrowid, dictionary.as_bytes())
+    trained = sum(len(body_codec.compressor.compress(body)) for body in bodies)
+    ScraperLogger.log_info(
+        f"Saved dictionary {cursor.lastrowid} trained on {len(bodies)} bodies: "
+        f"{plain} bytes compressed before, {trained} with it"
+    )
+    return cursor.lastrowid
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage compressed article bodies.")
+    parser.add_argument("--database", default="scraper_database.db")
+    parser.add_argument(
+        "--train-dictionary",
+        action="store_true",
+        help="train a zstd dictionary on stored articles for new bodies to use",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=2000, help="bodies to train the dictionary on"
+    )
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.database) as conn:
+        if args.train_dictionary:
+            train_dictionary(conn, args.samples)
+        else:
+            stats = conn.execute(
+                "SELECT codec, COUNT(*), SUM(LENGTH(body)) FROM article_content "
+                "GROUP BY codec"
+            ).fetchall()
+            for codec, count, size in stats:
+                print(f"{codec}: {count} bodies, {size} bytes")
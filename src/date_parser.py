@@ -0,0 +1,159 @@
+import re
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+
+MONTHS = {
+    "janeiro": 1,
+    "jan": 1,
+    "fevereiro": 2,
+    "fev": 2,
+    "marco": 3,
+    "mar": 3,
+    "abril": 4,
+    "abr": 4,
+    "maio": 5,
+    "mai": 5,
+    "junho": 6,
+    "jun": 6,
+    "julho": 7,
+    "jul": 7,
+    "agosto": 8,
+    "ago": 8,
+    "setembro": 9,
+    "set": 9,
+    "outubro": 10,
+    "out": 10,
+    "novembro": 11,
+    "nov": 11,
+    "dezembro": 12,
+    "dez": 12,
+}
+
+_MONTH = r"(?P<month>[a-z]{3,9})\.?"
+_TIME = r"(?:\s*(?:,|-|as|a)?\s*(?P<hour>\d{1,2})[:h](?P<minute>\d{2})(?::(?P<second>\d{2}))?)?"
+_WEEKDAY = r"(?:[a-z]+(?:-feira)?,?\s+)?"
+
+# Precompiled layouts, matched against the lowercased, accent-stripped string
+PATTERNS = {
+    # 17 de outubro de 2023, 17 out 2023 10:30, terca-feira, 17 de outubro, 2023
+    "textual": re.compile(
+        rf"^{_WEEKDAY}(?P<day>\d{{1,2}})(?:\s+de)?\s+{_MONTH},?(?:\s+de)?\s+"
+        rf"(?P<year>\d{{4}}){_TIME}$"
+    ),
+    # outubro 17, 2023
+    "month_first": re.compile(
+        rf"^{_WEEKDAY}{_MONTH}\s+(?P<day>\d{{1,2}}),?\s+(?P<year>\d{{4}}){_TIME}$"
+    ),
+    # 17/10/2023, 17-10-2023 10:30, 17.10.2023
+    "numeric": re.compile(
+        rf"^{_WEEKDAY}(?P<day>\d{{1,2}})[/.-](?P<month>\d{{1,2}})[/.-]"
+        rf"(?P<year>\d{{4}}){_TIME}$"
+    ),
+    # 2023-10-17, 2023-10-17 10:30:00, 2023-10-17T10:30
+    "iso": re.compile(
+        r"^(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})"
+        r"(?:[t\s]+(?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?)?$"
+    ),
+}
+
+# Layouts tried first for each source, in order; the others are tried after
+SOURCE_PATTERNS = {
+    "anacao": ("textual", "month_first", "numeric"),
+    "santiagomagazine": ("numeric", "textual"),
+    "expressodasilhas": ("textual", "numeric"),
+}
+
+stats = Counter()
+# Counters of the parse worker processes, by pid, as they last reported them
+worker_stats = {}
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text)
+
+
+def _build(match):
+    parts = match.groupdict()
+    month = parts["month"]
+    month = int(month) if month.isdigit() else MONTHS.get(month[:3])
+    if month is None:
+        return None
+    try:
+        return datetime(
+            int(parts["year"]),
+            month,
+            int(parts["day"]),
+            int(parts.get("hour") or 0),
+            int(parts.get("minute") or 0),
+            int(parts.get("second") or 0),
+        )
+    except ValueError:
+        return None
+
+
+def _fast_parse(text, source):
+    names = SOURCE_PATTERNS.get(source, ())
+    names += tuple(name for name in PATTERNS if name not in names)
+    for name in names:
+        match = PATTERNS[name].match(text)
+        if match is not None:
+            date = _build(match)
+            if date is not None:
+                return date
+    return None
+
+
+@lru_cache(maxsize=8192)
+def _cached_fast_parse(text, source):
+    return _fast_parse(_normalize(text), source)
+
+
+def parse_date(text, source=None, timezone=None):
+    """Parse a publication date as written on source's pages.
+
+    Known per-source layouts (with Portuguese month names) are tried first and
+    memoized per string; anything else, such as relative dates, goes to
+    dateparser, uncached since "ha 2 horas" means a different date every
+    hour. Naive datetimes are returned like dateparser does.
+    """
+    if not text:
+        return None
+    date = _cached_fast_parse(text, source)
+    if date is not None:
+        stats["fast_path"] += 1
+        return date
+
+    # Imported on a miss only: loading dateparser alone takes a noticeable
+    # share of a short run's startup
+    import dateparser
+
+    settings = {"TIMEZONE": timezone} if timezone else None
+    date = dateparser.parse(text, settings=settings)
+    stats["fallback" if date is not None else "failed"] += 1
+    return date
+
+
+def record_worker_stats(pid, counters):
+    """Keep the date_parse_stats() a parse worker process returned."""
+    worker_stats[pid] = counters
+
+
+def date_parse_stats():
+    """Counters for the fast path, the dateparser fallback and the memo cache,
+    of this process and its parse workers, for every source."""
+    cache = _cached_fast_parse.cache_info()
+    totals = {
+        "fast_path": stats["fast_path"],
+        "fallback": stats["fallback"],
+        "failed": stats["failed"],
+        "cache_hits": cache.hits,
+        "cache_misses": cache.misses,
+    }
+    for counters in worker_stats.values():
+        for name, count in counters.items():
+            totals[name] += count
+    return totals
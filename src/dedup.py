@@ -0,0 +1,202 @@
+"""Near-duplicate detection for article bodies.
+
+The same wire story is often published by several sites under different
+URLs. Each body is fingerprinted with a hash of its normalized text, which
+catches exact copies, and a 64-bit SimHash of its word shingles, which stays
+within a few bits for copies that differ by a byline or a trimmed paragraph.
+The SimHash is split into four 16-bit bands: two fingerprints at most three
+bits apart share at least one band, so the indexed bands find every candidate
+with a handful of lookups however large the archive grows.
+
+Articles stored before fingerprints existed are indexed with
+``python -m src.dedup --backfill``.
+"""
+
+import argparse
+import hashlib
+import html
+import re
+import sqlite3
+import unicodedata
+
+from .content import attach
+from .scraper_logger import ScraperLogger
+
+SHINGLE_SIZE = 3
+# Bits two SimHashes may differ by and still be near-duplicates. The band
+# lookup finds every match up to BANDS - 1 bits.
+MAX_DISTANCE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize_text(text):
+    """Lowercased words of a body, without markup, punctuation or accents."""
+    text = html.unescape(TAG_PATTERN.sub(" ", text))
+    # Decomposing splits accents off their letters; dropping what is not ASCII
+    # then removes them (and any other symbol) in one pass
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore")
+    return WORD_PATTERN.findall(text.decode("ascii"))
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+# BIT_TABLES[bit] translates a byte to 1 if it has that bit set, else 0
+BIT_TABLES = [bytes(byte >> bit & 1 for byte in range(256)) for bit in range(8)]
+
+
+def simhash(words):
+    shingles = set(map(" ".join, zip(*(words[i:] for i in range(SHINGLE_SIZE))))) or {
+        " ".join(words)
+    }
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        for shingle in shingles
+    )
+    # Count how many hashes set each of the 64 bits with bytes operations
+    # rather than a Python loop over every bit of every hash
+    value = 0
+    for bit in range(8):
+        flags = digests.translate(BIT_TABLES[bit])
+        for position in range(8):
+            # A bit is set when most shingle hashes have it set
+            if 2 * flags[position::8].count(1) > len(shingles):
+                value |= 1 << (8 * (7 - position) + bit)
+    return value
+
+
+def fingerprint(text):
+    """(content_hash, simhash, bands) of a body, or None if it has no words."""
+    words = normalize_text(text or "")
+    if not words:
+        return None
+    value = simhash(words)
+    bands = tuple(
+        value >> (band * BAND_BITS) & ((1 << BAND_BITS) - 1) for band in range(BANDS)
+    )
+    return _signed(_hash64(" ".join(words).encode("utf-8"))), _signed(value), bands
+
+
+def distance(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+FIND_CANDIDATES = (
+    "SELECT article_id, content_hash, simhash FROM article_fingerprints "
+    "WHERE content_hash = ? "
+    + "".join(
+        f"UNION SELECT article_id, content_hash, simhash FROM article_fingerprints "
+        f"WHERE band{band} = ? "
+        for band in range(BANDS)
+    )
+)
+
+
+def is_duplicate(content_hash, value, other_hash, other_value):
+    return other_hash == content_hash or distance(value, other_value) <= MAX_DISTANCE
+
+
+def find_duplicate(candidates, content_hash, value, article_id=None):
+    """The candidate (article_id, content_hash, simhash) closest to a
+    fingerprint, as (article_id, "exact" or "near"), or None. Only articles
+    stored before article_id count, so that the first stored copy is the one
+    the others are duplicates of."""
+    best = None
+    for other_id, other_hash, other_value in candidates:
+        if article_id is not None and other_id >= article_id:
+            continue
+        if other_hash == content_hash:
+            return other_id, "exact"
+        bits = distance(value, other_value)
+        if bits <= MAX_DISTANCE and (best is None or bits < best[1]):
+            best = other_id, bits
+    return (best[0], "near") if best else None
+
+
+def backfill(conn, chunk_size=500):
+    """Fingerprint the stored articles that have no fingerprint yet.
+
+    Copies stored after one of them, while it had no fingerprint, were taken
+    for originals (or duplicates of a later copy); they are pointed at it.
+    """
+    attach(conn)
+    last_id, indexed, duplicates, repointed = 0, 0, 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT a.id, a.text_html FROM articles_full a "
+            "LEFT JOIN article_fingerprints f ON f.article_id = a.id "
+            "WHERE a.id > ? AND f.article_id IS NULL ORDER BY a.id LIMIT ?",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            break
+
+        for article_id, text in rows:
+            result = fingerprint(text)
+            if result is None:
+                continue
+            content_hash, value, bands = result
+            candidates = conn.execute(
+                FIND_CANDIDATES, (content_hash, *bands)
+            ).fetchall()
+            duplicate = find_duplicate(candidates, content_hash, value, article_id)
+            conn.execute(
+                "INSERT INTO article_fingerprints "
+                "(article_id, content_hash, simhash, band0, band1, band2, band3, "
+                "duplicate_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (article_id, content_hash, value, *bands, duplicate and duplicate[0]),
+            )
+            indexed += 1
+            duplicates += duplicate is not None
+
+            before = conn.total_changes
+            conn.executemany(
+                "UPDATE article_fingerprints SET duplicate_of = ? "
+                "WHERE article_id = ? AND (duplicate_of IS NULL OR duplicate_of > ?)",
+                [
+                    (duplicate[0] if duplicate else article_id, other_id, article_id)
+                    for other_id, other_hash, other_value in candidates
+                    if other_id > article_id
+                    and is_duplicate(content_hash, value, other_hash, other_value)
+                ],
+            )
+            repointed += conn.total_changes - before
+        conn.commit()
+        last_id = rows[-1][0]
+
+    ScraperLogger.log_info(
+        f"Fingerprinted {indexed} articles, {duplicates} of them duplicates; "
+        f"{repointed} later copies now point at an earlier one"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find duplicate articles.")
+    parser.add_argument("--database", default="scraper_database.db")
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="fingerprint articles stored before duplicate detection existed",
+    )
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.database) as conn:
+        if args.backfill:
+            backfill(conn)
+        for source, duplicate_source, count in conn.execute(
+            "SELECT a.source, d.source, COUNT(*) FROM article_fingerprints f "
+            "JOIN articles a ON a.id = f.article_id "
+            "JOIN articles d ON d.id = f.duplicate_of "
+            "GROUP BY a.source, d.source ORDER BY COUNT(*) DESC"
+        ):
+            print(f"{source} duplicates of {duplicate_source}: {count}")
@@ -0,0 +1,228 @@
+"""Export stored articles to JSON lines, Parquet or Arrow files.
+
+Articles are read in chunks of consecutive ids (keyset pagination, never
+OFFSET) and each chunk is written out before the next one is read, so memory
+stays the same however large the archive is. Parquet and Arrow need the
+optional pyarrow package; each chunk becomes one row group or record batch.
+
+With --state PATH only the articles stored since the previous export with the
+same state file are exported, and PATH records the last exported id once the
+export is complete:
+
+    python -m src.export --output articles-2024-07.parquet --state export.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+
+from .content import attach
+from .scraper_logger import ScraperLogger
+
+COLUMNS = (
+    "id",
+    "source",
+    "title",
+    "author",
+    "date_pub",
+    "link",
+    "topic",
+    "text_html",
+    "duplicate_of",
+)
+FORMATS = ("jsonl", "parquet", "arrow")
+
+
+def read_chunks(conn, after_id=0, sources=None, since=None, until=None, size=1000):
+    """Yield lists of article rows (tuples of COLUMNS) in id order."""
+    attach(conn)
+    query = (
+        "SELECT a.id, a.source, a.title, a.author, a.date_pub, a.link, a.topic, "
+        "a.text_html, f.duplicate_of FROM articles_full a "
+        "LEFT JOIN article_fingerprints f ON f.article_id = a.id WHERE a.id > ?"
+    )
+    # The filters are written +column so that SQLite walks the articles in id
+    # order instead of using the source/date index: that index would sort
+    # every matching article (body included) again for each chunk
+    params = []
+    if sources:
+        query += " AND +a.source IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(sources)))
+    # date_pub is stored as "YYYY-MM-DD HH:MM:SS", so dates compare as text
+    if since:
+        query += " AND +a.date_pub >= ?"
+        params.append(since)
+    if until:
+        query += " AND +a.date_pub < ?"
+        params.append(until)
+    query += " ORDER BY a.id LIMIT ?"
+
+    while True:
+        rows = conn.execute(query, (after_id, *params, size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+class JsonLinesWriter:
+    def __init__(self, path, compress=False):
+        opener = gzip.open if compress else open
+        self.file = opener(path, "wt", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False))
+            self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    """Writes chunks as Parquet row groups or Arrow IPC record batches."""
+
+    def __init__(self, path, format):
+        # Imported here, as JSON lines exports do without it and it is slow to
+        # load
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError(f"The {format} format needs the pyarrow package")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema(
+            [
+                (
+                    name,
+                    pyarrow.int64()
+                    if name in ("id", "duplicate_of")
+                    else pyarrow.string(),
+                )
+                for name in COLUMNS
+            ]
+        )
+        if format == "parquet":
+            self.writer = pyarrow.parquet.ParquetWriter(
+                path, self.schema, compression="zstd"
+            )
+        else:
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def write(self, rows):
+        pyarrow = self.pyarrow
+        columns = list(zip(*rows))
+        self.writer.write_table(
+            pyarrow.Table.from_arrays(
+                [
+                    pyarrow.array(column, type)
+                    for column, type in zip(columns, self.schema.types)
+                ],
+                schema=self.schema,
+            )
+        )
+
+    def close(self):
+        self.writer.close()
+
+
+def format_of(path):
+    if path.endswith(".parquet"):
+        return "parquet"
+    if path.endswith((".arrow", ".feather")):
+        return "arrow"
+    return "jsonl"
+
+
+def export(conn, path, format=None, state=None, after_id=0, chunk_size=1000, **filters):
+    """Write the selected articles to path and return how many were written.
+
+    filters are read_chunks()'s sources, since and until. With a state file,
+    the export starts after the id it recorded and records the new last id.
+    """
+    if state is not None and os.path.exists(state):
+        with open(state) as f:
+            after_id = max(after_id, json.load(f)["last_id"])
+
+    format = format or format_of(path)
+    # Written under a temporary name, so an interrupted export leaves no
+    # partial file behind under the real one
+    partial = f"{path}.partial"
+    if format == "jsonl":
+        # .gz outputs are compressed on the fly
+        writer = JsonLinesWriter(partial, compress=path.endswith(".gz"))
+    else:
+        writer = ArrowWriter(partial, format)
+    exported, last_id = 0, after_id
+    try:
+        for rows in read_chunks(conn, after_id, size=chunk_size, **filters):
+            writer.write(rows)
+            exported += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        writer.close()
+    os.replace(partial, path)
+
+    if state is not None:
+        with open(state, "w") as f:
+            json.dump({"last_id": last_id, "output": path}, f)
+    ScraperLogger.log_info(
+        f"Exported {exported} articles to {path}, up to id {last_id}"
+    )
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored articles.")
+    parser.add_argument("--database", default="scraper_database.db")
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        required=True,
+        help="file to write; .jsonl(.gz), .parquet or .arrow picks the format",
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default=None,
+        help="output format, when it is not the one of the file extension",
+    )
+    parser.add_argument(
+        "--sites", nargs="+", default=None, help="only export these sources"
+    )
+    parser.add_argument(
+        "--since", metavar="DATE", default=None, help="published on or after DATE"
+    )
+    parser.add_argument(
+        "--until", metavar="DATE", default=None, help="published before DATE"
+    )
+    parser.add_argument(
+        "--after-id", type=int, default=0, help="only articles with a greater id"
+    )
+    parser.add_argument(
+        "--state",
+        metavar="PATH",
+        default=None,
+        help="export only what is new since the last export with this state "
+        "file, and update it",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000, help="articles read at a time"
+    )
+    args = parser.parse_args()
+
+    with sqlite3.connect(args.database) as conn:
+        export(
+            conn,
+            args.output,
+            format=args.format,
+            state=args.state,
+            after_id=args.after_id,
+            chunk_size=args.chunk_size,
+            sources=args.sites,
+            since=args.since,
+            until=args.until,
+        )
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+import zlib
+
+import aiosqlite
+from httpx import Request, Response
+
+from .scraper_logger import ScraperLogger
+
+
+class HttpCache:
+    """On-disk cache of GET responses, keyed by URL.
+
+    Bodies are stored zlib-compressed along with the validators (ETag and
+    Last-Modified) needed to revalidate them with a conditional GET. Entries
+    older than ttl seconds are dropped, and the least recently used ones are
+    evicted once the stored bodies exceed max_bytes.
+
+    One cache is shared by the scrapers of a process, but shard processes and
+    other runners may use the same file. A cache that cannot be read or
+    written in time is skipped: the page is fetched as on a miss, and the
+    response is not stored.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = None
+        self.total_bytes = 0
+        self.stats = {
+            "hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "stored": 0,
+            "errors": 0,
+        }
+        # Writes of the scrapers sharing the connection are not interleaved
+        self.lock = asyncio.Lock()
+
+    async def open(self):
+        self.conn = await aiosqlite.connect(self.path, timeout=10)
+        # Losing the tail of a cache on a crash is harmless
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA synchronous=OFF")
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                headers TEXT,
+                body BLOB,
+                size INTEGER,
+                stored_at REAL,
+                accessed_at REAL
+            )
+        """
+        )
+        await self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed_at "
+            "ON responses (accessed_at)"
+        )
+        await self.conn.execute(
+            "DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,)
+        )
+        await self.conn.commit()
+
+        async with self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ) as cursor:
+            (self.total_bytes,) = await cursor.fetchone()
+
+    async def close(self):
+        if self.conn is not None:
+            await self.conn.close()
+            self.conn = None
+        ScraperLogger.log_info(f"HTTP cache {self.path}: {self.stats}")
+
+    def error(self, action, url, e):
+        self.stats["errors"] += 1
+        ScraperLogger.log_warning(f"HTTP cache {action} failed for {url}: {e}")
+
+    async def get(self, url):
+        try:
+            async with self.conn.execute(
+                "SELECT etag, last_modified, headers, body, stored_at "
+                "FROM responses WHERE url = ?",
+                (url,),
+            ) as cursor:
+                row = await cursor.fetchone()
+        except aiosqlite.Error as e:
+            self.error("read", url, e)
+            return None
+
+        if row is None or row[4] < time.time() - self.ttl:
+            self.stats["misses"] += 1
+            return None
+
+        etag, last_modified, headers, body, _ = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "headers": json.loads(headers),
+            "body": zlib.decompress(body),
+        }
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    async def hit(self, url, entry, revalidated=False):
+        """Count a cache hit and return the cached entry as a 200 response."""
+        self.stats["revalidated" if revalidated else "hits"] += 1
+        now = time.time()
+        # A 304 confirms the body is still current, so it restarts the TTL
+        try:
+            async with self.lock:
+                await self.conn.execute(
+                    "UPDATE responses SET accessed_at = ?"
+                    + (", stored_at = ?" if revalidated else "")
+                    + " WHERE url = ?",
+                    (now, now, url) if revalidated else (now, url),
+                )
+                await self.conn.commit()
+        except aiosqlite.Error as e:
+            # Only the eviction order and TTL bookkeeping are lost
+            await self.conn.rollback()
+            self.error("update", url, e)
+        return Response(
+            200,
+            headers=entry["headers"],
+            content=entry["body"],
+            request=Request("GET", url),
+        )
+
+    async def store(self, url, response):
+        body = zlib.compress(response.content)
+        # Keep only what is needed to rebuild a decodable response
+        headers = {
+            name: response.headers[name]
+            for name in ("content-type", "etag", "last-modified")
+            if name in response.headers
+        }
+        now = time.time()
+
+        total_bytes = self.total_bytes
+        try:
+            async with self.lock:
+                async with self.conn.execute(
+                    "SELECT size FROM responses WHERE url = ?", (url,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                if row is not None:
+                    self.total_bytes -= row[0]
+
+                await self.conn.execute(
+                    """
+                    INSERT OR REPLACE INTO responses
+                    (url, etag, last_modified, headers, body, size, stored_at, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                    (
+                        url,
+                        response.headers.get("etag"),
+                        response.headers.get("last-modified"),
+                        json.dumps(headers),
+                        body,
+                        len(body),
+                        now,
+                        now,
+                    ),
+                )
+                self.total_bytes += len(body)
+
+                if self.total_bytes > self.max_bytes:
+                    await self.evict()
+                await self.conn.commit()
+            self.stats["stored"] += 1
+        except aiosqlite.Error as e:
+            # The rollback undoes the evictions as well
+            await self.conn.rollback()
+            self.total_bytes = total_bytes
+            self.error("store", url, e)
+
+    async def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        async with self.conn.execute(
+            "SELECT url, size FROM responses ORDER BY accessed_at"
+        ) as cursor:
+            urls = []
+            async for url, size in cursor:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                urls.append((url,))
+                self.total_bytes -= size
+
+        await self.conn.executemany("DELETE FROM responses WHERE url = ?", urls)
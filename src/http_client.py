@@ -0,0 +1,43 @@
+import functools
+
+from httpx import create_ssl_context
+
+
+@functools.lru_cache(maxsize=None)
+def ssl_context():
+    """The TLS context shared by every client in the process. Building one
+    loads the CA bundle, which each client would otherwise do on its own."""
+    return create_ssl_context()
+
+
+class ConnectionStats:
+    """Counts requests against the TCP connections and TLS handshakes they cost.
+
+    It is fed by httpcore's "trace" request extension, so every connection the
+    pool opens is seen, whatever transport the request was routed through.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    async def on_request(self, request):
+        self.requests += 1
+        request.extensions["trace"] = self.trace
+
+    async def trace(self, event, info):
+        if event == "connection.connect_tcp.complete":
+            self.connections += 1
+        elif event == "connection.start_tls.complete":
+            self.tls_handshakes += 1
+
+    def snapshot(self):
+        reused = max(self.requests - self.connections, 0)
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "tls_handshakes": self.tls_handshakes,
+            "reused": reused,
+            "reuse_ratio": round(reused / self.requests, 3) if self.requests else 0.0,
+        }
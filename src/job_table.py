@@ -0,0 +1,334 @@
+"""Crawl jobs shared by several runners through a table with leases.
+
+Listing pages and article fetches become jobs of a named run. A runner claims a
+job by taking a lease on it for lease_seconds, renews the leases it holds with
+heartbeats while it runs, and marks its jobs done or failed. Article jobs are
+only marked done by the storage worker, once their article is committed. Jobs
+whose lease ran out (their runner died or hung) are claimed again by the next
+runner asking, up to max_attempts times, and failed jobs are retried after a
+backoff. Jobs are unique within a run, so a page or article scheduled by
+several runners is only crawled once, and runners started with the same run
+name cooperate on it while a new name starts a fresh crawl.
+
+Runners also say they are alive with their heartbeats, so that each can split
+its request rates by the number of runners crawling the run. Leases are timed
+with the runners' clocks, which must roughly agree. The SQLite backend suits runners sharing a disk; other backends implement
+JobTable and are registered in JOB_BACKENDS.
+"""
+
+import abc
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+
+import aiosqlite
+
+from .scraper_logger import ScraperLogger
+
+# Columns of a claimed job, in the order claim() returns them
+JOB_COLUMNS = ("id", "kind", "url", "section", "cursor", "seen_streak", "attempts")
+
+
+def runner_name():
+    """Name a runner's leases are taken under: host, process and a random
+    suffix, so a restarted process never renews its predecessor's leases."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class JobTable(abc.ABC):
+    """Interface of the job table backends.
+
+    Jobs are added as (url, section, cursor, seen_streak) tuples, where
+    seen_streak carries a section's incremental-mode streak of listing pages
+    without new articles over to its next page. Claimed jobs are dicts of
+    JOB_COLUMNS.
+    """
+
+    def __init__(self, run=None, lease_seconds=60.0, max_attempts=5):
+        # Runs are named after the day by default, so that runners started the
+        # same day share a crawl
+        self.run = run or time.strftime("%Y-%m-%d", time.gmtime())
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = runner_name()
+        # Runners of the run heard from within a lease, this one included, as
+        # of the last heartbeat
+        self.active_runners = 1
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def add(self, source, kind, jobs):
+        """Add jobs, skipping those the run already has; return how many were new."""
+
+    @abc.abstractmethod
+    async def claim(self, source, kind):
+        """Lease the next available job of source and kind, or return None."""
+
+    @abc.abstractmethod
+    async def heartbeat(self):
+        """Extend every lease this runner holds, and record it as alive."""
+
+    @abc.abstractmethod
+    async def complete(self, jobs):
+        """Mark jobs, given as (job_id, owner) pairs, done. Returns how many
+        were still leased to their owner, the others having been lost to
+        another runner."""
+
+    @abc.abstractmethod
+    async def fail(self, job_id, error, retry_in=0.0):
+        """Give a job back to be retried in retry_in seconds, or fail it for
+        good once it used up its attempts; False if its lease was lost to
+        another runner."""
+
+    @abc.abstractmethod
+    async def remaining(self, source, kinds):
+        """Number of jobs of source and kinds still pending or leased."""
+
+    @abc.abstractmethod
+    async def counts(self):
+        """Number of jobs of the run by kind and status."""
+
+    @abc.abstractmethod
+    async def runners(self):
+        """Number of runners of the run that sent a heartbeat within a lease."""
+
+    async def renew_leases(self):
+        """Heartbeat every third of a lease, until cancelled, and count the
+        runners alive meanwhile."""
+        while True:
+            try:
+                await self.heartbeat()
+                runners = max(await self.runners(), 1)
+            except Exception as e:
+                ScraperLogger.log_warning(f"Could not renew job leases: {e}")
+            else:
+                if runners != self.active_runners:
+                    ScraperLogger.log_info(f"{runners} runners crawl run {self.run}")
+                self.active_runners = runners
+            await asyncio.sleep(self.lease_seconds / 3)
+
+
+class SqliteJobTable(JobTable):
+    """Job table in a SQLite file, which may be the article database.
+
+    A claim is a single UPDATE ... RETURNING statement, so it takes the
+    database's write lock and no two runners can lease the same job.
+    """
+
+    def __init__(self, path, run=None, lease_seconds=60.0, max_attempts=5):
+        super().__init__(run, lease_seconds, max_attempts)
+        self.path = path
+        self.conn = None
+        # Coroutines of this runner share the connection; each operation is
+        # committed before the next one starts
+        self.lock = asyncio.Lock()
+
+    async def open(self):
+        # Other runners hold the write lock for short transactions only
+        self.conn = await aiosqlite.connect(self.path, timeout=30)
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS crawl_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run TEXT NOT NULL,
+                source TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                cursor TEXT NOT NULL DEFAULT '',
+                section TEXT,
+                seen_streak INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL,
+                available_at REAL NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_crawl_jobs_key
+                ON crawl_jobs (run, kind, url, cursor);
+            CREATE INDEX IF NOT EXISTS idx_crawl_jobs_status
+                ON crawl_jobs (run, source, kind, status);
+            CREATE INDEX IF NOT EXISTS idx_crawl_jobs_leases
+                ON crawl_jobs (owner) WHERE status = 'leased';
+            CREATE TABLE IF NOT EXISTS crawl_runners (
+                run TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (run, owner)
+            );
+            """
+        )
+        await self.conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            # The other runners take over this one's share of the rates at
+            # their next heartbeat, rather than once its last one expires
+            await self.conn.execute(
+                "DELETE FROM crawl_runners WHERE run = ? AND owner = ?",
+                (self.run, self.owner),
+            )
+            await self.conn.commit()
+            await self.conn.close()
+            self.conn = None
+
+    async def add(self, source, kind, jobs):
+        # cursor is '' rather than NULL, as NULLs never collide in the
+        # unique index
+        rows = [
+            (self.run, source, kind, url, cursor or "", section, seen_streak)
+            for url, section, cursor, seen_streak in jobs
+        ]
+        if not rows:
+            return 0
+        async with self.lock:
+            before = self.conn.total_changes
+            await self.conn.executemany(
+                "INSERT OR IGNORE INTO crawl_jobs "
+                "(run, source, kind, url, cursor, section, seen_streak) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            added = self.conn.total_changes - before
+            await self.conn.commit()
+        return added
+
+    async def claim(self, source, kind):
+        now = time.time()
+        async with self.lock:
+            # A job whose lease ran out on its last attempt is failed rather
+            # than leased again
+            await self.conn.execute(
+                "UPDATE crawl_jobs SET status = 'failed', owner = NULL, "
+                "error = 'lease expired' WHERE run = ? AND source = ? AND kind = ? "
+                "AND status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (self.run, source, kind, now, self.max_attempts),
+            )
+            rows = await self.conn.execute_fetchall(
+                """
+                UPDATE crawl_jobs
+                SET status = 'leased', owner = ?, lease_until = ?,
+                    attempts = attempts + 1
+                WHERE id = (
+                    SELECT id FROM crawl_jobs
+                    WHERE run = ? AND source = ? AND kind = ? AND (
+                        (status = 'pending' AND available_at <= ?)
+                        OR (status = 'leased' AND lease_until < ?)
+                    )
+                    ORDER BY id LIMIT 1
+                )
+                RETURNING id, kind, url, section, cursor, seen_streak, attempts
+                """,
+                (
+                    self.owner,
+                    now + self.lease_seconds,
+                    self.run,
+                    source,
+                    kind,
+                    now,
+                    now,
+                ),
+            )
+            await self.conn.commit()
+        if not rows:
+            return None
+        job = dict(zip(JOB_COLUMNS, rows[0]))
+        job["cursor"] = job["cursor"] or None
+        return job
+
+    async def heartbeat(self):
+        now = time.time()
+        async with self.lock:
+            await self.conn.execute(
+                "UPDATE crawl_jobs SET lease_until = ? WHERE owner = ? "
+                "AND status = 'leased'",
+                (now + self.lease_seconds, self.owner),
+            )
+            await self.conn.execute(
+                "INSERT OR REPLACE INTO crawl_runners (run, owner, seen_at) "
+                "VALUES (?, ?, ?)",
+                (self.run, self.owner, now),
+            )
+            await self.conn.commit()
+
+    async def complete(self, jobs):
+        async with self.lock:
+            before = self.conn.total_changes
+            await self.conn.executemany(
+                "UPDATE crawl_jobs SET status = 'done', lease_until = NULL, "
+                "error = NULL WHERE id = ? AND owner = ? AND status = 'leased'",
+                jobs,
+            )
+            completed = self.conn.total_changes - before
+            await self.conn.commit()
+        return completed
+
+    async def fail(self, job_id, error, retry_in=0.0):
+        async with self.lock:
+            cursor = await self.conn.execute(
+                "UPDATE crawl_jobs SET "
+                "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "owner = NULL, lease_until = NULL, available_at = ?, error = ? "
+                "WHERE id = ? AND owner = ? AND status = 'leased'",
+                (
+                    self.max_attempts,
+                    time.time() + retry_in,
+                    error,
+                    job_id,
+                    self.owner,
+                ),
+            )
+            await self.conn.commit()
+        return cursor.rowcount == 1
+
+    async def remaining(self, source, kinds):
+        async with self.lock:
+            rows = await self.conn.execute_fetchall(
+                "SELECT COUNT(*) FROM crawl_jobs WHERE run = ? AND source = ? "
+                "AND kind IN (SELECT value FROM json_each(?)) "
+                "AND status IN ('pending', 'leased')",
+                (self.run, source, json.dumps(list(kinds))),
+            )
+        return rows[0][0]
+
+    async def counts(self):
+        async with self.lock:
+            rows = await self.conn.execute_fetchall(
+                "SELECT kind, status, COUNT(*) FROM crawl_jobs WHERE run = ? "
+                "GROUP BY kind, status",
+                (self.run,),
+            )
+        counts = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {})[status] = count
+        return counts
+
+    async def runners(self):
+        async with self.lock:
+            rows = await self.conn.execute_fetchall(
+                "SELECT COUNT(*) FROM crawl_runners WHERE run = ? AND seen_at >= ?",
+                (self.run, time.time() - self.lease_seconds),
+            )
+        return rows[0][0]
+
+
+# Job table backends by name
+JOB_BACKENDS = {"sqlite": SqliteJobTable}
+
+
+def create_job_table(path, backend="sqlite", **options):
+    """Build the job table of backend at path (not opened yet)."""
+    if backend not in JOB_BACKENDS:
+        raise ValueError(f"Unknown job table backend: {backend}")
+    table = JOB_BACKENDS[backend](path, **options)
+    ScraperLogger.log_info(f"Sharing crawl jobs of run {table.run} through {path}")
+    return table
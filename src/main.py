@@ -1,15 +1,312 @@
+import argparse
 import asyncio
 
-from .scrapers.anacao_scraper import main as anacao_main
-from .scrapers.expressodasilhas_scraper import main as expressodasilhas_main
-from .scrapers.santiagomagazine_scraper import main as santiagomagazine_main
+from .job_table import JOB_BACKENDS
+from .metrics import MetricsExporter
+from .orchestrator import SCRAPERS, Orchestrator
+from .proxy_pool import ProxyPool
+from .utils import config
 
 
-async def main():
-    await asyncio.gather(
-        anacao_main(), expressodasilhas_main(), santiagomagazine_main()
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape Cape-Verdean news websites.")
+    parser.add_argument(
+        "--sites",
+        nargs="+",
+        choices=sorted(SCRAPERS),
+        default=None,
+        help="sites to scrape (all by default)",
     )
+    parser.add_argument(
+        "--sections",
+        nargs="+",
+        metavar="SECTION",
+        default=None,
+        help="only crawl these sections, by name (e.g. politica economia)",
+    )
+    parser.add_argument(
+        "--full-crawl",
+        action="store_true",
+        help="walk every listing page instead of stopping at already-seen ones",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue each section from its last checkpoint, skipping sections "
+        "the interrupted crawl finished",
+    )
+    parser.add_argument(
+        "--max-seen-pages",
+        type=int,
+        default=2,
+        help="consecutive listing pages without new articles before a section "
+        "stops paginating (incremental mode only)",
+    )
+    parser.add_argument(
+        "--url-index",
+        choices=("set", "hashed", "bloom"),
+        default="set",
+        help="in-memory representation of already processed URLs; hashed and "
+        "bloom keep memory small on large archives",
+    )
+    parser.add_argument(
+        "--section-concurrency",
+        type=int,
+        default=4,
+        help="sections crawled in parallel per site",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=8,
+        help="article requests in flight per site",
+    )
+    parser.add_argument(
+        "--parse-executor",
+        choices=("thread", "process"),
+        default=None,
+        help="parse articles in a worker pool instead of on the event loop",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        help="size of the parse pool (defaults to the number of CPUs)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="split the sections across this many crawler processes, feeding "
+        "one database writer",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=30.0,
+        help="seconds between per-shard progress reports",
+    )
+    parser.add_argument(
+        "--job-table",
+        metavar="PATH",
+        default=None,
+        help="share the crawl with the runners using the job table at PATH "
+        "(a SQLite file, which may be the database): they claim listing pages "
+        "and articles under leases instead of each crawling every section",
+    )
+    parser.add_argument(
+        "--job-backend",
+        choices=sorted(JOB_BACKENDS),
+        default="sqlite",
+        help="storage of the job table",
+    )
+    parser.add_argument(
+        "--job-run",
+        metavar="NAME",
+        default=None,
+        help="crawl the job table shares; runners given the same name "
+        "cooperate (defaults to the current UTC date)",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=60.0,
+        help="seconds a job stays leased to a runner that stops renewing it, "
+        "before another runner retries it",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=1000,
+        help="parsed articles held for the database writer before scrapers wait",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=200,
+        help="articles written per transaction",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=float,
+        default=2.0,
+        help="seconds an article may wait for its batch to fill before it is written",
+    )
+    parser.add_argument(
+        "--body-codec",
+        choices=("zstd", "zlib"),
+        default=None,
+        help="compression of stored article bodies (zstd when zstandard is "
+        "installed, zlib otherwise)",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=("off", "flag", "skip"),
+        default="flag",
+        help="near-duplicate bodies (the same story on several sites): flag them "
+        "as duplicates of the stored article, or also skip storing their body",
+    )
+    parser.add_argument(
+        "--page-archive",
+        metavar="DIR",
+        default=None,
+        help="archive fetched article pages under DIR, to parse them again later "
+        "with python -m src.reparse",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=20,
+        help="pooled connections per site",
+    )
+    parser.add_argument(
+        "--keepalive-expiry",
+        type=float,
+        default=30.0,
+        help="seconds an idle pooled connection is kept open",
+    )
+    parser.add_argument(
+        "--http2",
+        action="store_true",
+        help="negotiate HTTP/2 where supported (needs httpx[http2])",
+    )
+    parser.add_argument(
+        "--http-cache",
+        metavar="PATH",
+        default=None,
+        help="keep an on-disk HTTP cache at PATH and revalidate listing pages "
+        "with conditional GETs",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=7 * 24,
+        help="hours a cached response is kept",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=512,
+        help="size of the HTTP cache before least recently used entries go",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=4.0,
+        help="initial requests per second per host; adapts to the host's latency "
+        "and errors",
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=float,
+        default=20.0,
+        help="ceiling for the adaptive per-host request rate",
+    )
+    parser.add_argument(
+        "--proxies-file",
+        metavar="PATH",
+        default=None,
+        help="rotate requests across the proxies listed in PATH (one per line); "
+        "PROXY_FILE or PROXIES in .env work too",
+    )
+    parser.add_argument(
+        "--proxy-stats",
+        metavar="PATH",
+        default=None,
+        help="write per-proxy latency and success rates to PATH as JSON",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve metrics on this port (/metrics for Prometheus, /metrics.json)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        default=None,
+        help="write a JSON snapshot of the metrics to PATH periodically",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=30.0,
+        help="seconds between JSON metrics snapshots",
+    )
+    return parser.parse_args()
+
+
+async def main(
+    base_urls=None,
+    proxies_file=None,
+    proxy_stats=None,
+    metrics_port=None,
+    metrics_json=None,
+    metrics_interval=30.0,
+    **scraper_options,
+):
+    exporter = MetricsExporter(
+        port=metrics_port, json_path=metrics_json, interval=metrics_interval
+    )
+    await exporter.start()
+
+    proxy_pool = None
+    try:
+        proxy_pool = ProxyPool.from_config(config, proxies_file)
+        if proxy_pool is not None:
+            await proxy_pool.health_check()
+
+        # base_urls maps a source to the address it is scraped from, so the
+        # sites can be pointed at a local stand-in (see benchmarks/)
+        await Orchestrator(
+            base_urls=base_urls, proxy_pool=proxy_pool, **scraper_options
+        ).run()
+    finally:
+        # Also when the crawl failed or was cancelled, when the proxy stats
+        # and the last metrics snapshot are most useful
+        if proxy_pool is not None and proxy_stats is not None:
+            proxy_pool.export(proxy_stats)
+        await exporter.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(
+        main(
+            sites=args.sites,
+            sections=args.sections,
+            incremental=not args.full_crawl,
+            resume=args.resume,
+            max_seen_pages=args.max_seen_pages,
+            url_index=args.url_index,
+            section_concurrency=args.section_concurrency,
+            max_in_flight=args.max_in_flight,
+            parse_executor=args.parse_executor,
+            parse_workers=args.parse_workers,
+            shards=args.shards,
+            progress_interval=args.progress_interval,
+            job_table=args.job_table,
+            job_backend=args.job_backend,
+            job_run=args.job_run,
+            lease_seconds=args.lease_seconds,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            body_codec=args.body_codec,
+            dedup=args.dedup,
+            page_archive=args.page_archive,
+            max_connections=args.max_connections,
+            keepalive_expiry=args.keepalive_expiry,
+            http2=args.http2,
+            http_cache=args.http_cache,
+            cache_ttl=args.cache_ttl * 3600,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            requests_per_second=args.rate,
+            max_requests_per_second=args.max_rate,
+            proxies_file=args.proxies_file,
+            proxy_stats=args.proxy_stats,
+            metrics_port=args.metrics_port,
+            metrics_json=args.metrics_json,
+            metrics_interval=args.metrics_interval,
+        )
+    )
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import time
+
+from .scraper_logger import ScraperLogger
+
+# Upper bounds, in seconds, for latency histograms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+    def snapshot(self):
+        return [
+            {"labels": dict(key), "value": value} for key, value in self.values.items()
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for key, series in self.values.items():
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", key + (("le", bound),), count
+            yield f"{self.name}_bucket", key + (("le", "+Inf"),), series[-2]
+            yield f"{self.name}_sum", key, series[-1]
+            yield f"{self.name}_count", key, series[-2]
+
+    def quantile(self, q, **labels):
+        """Estimate the q-quantile as the upper bound of the bucket holding it."""
+        series = self.values.get(_label_key(labels))
+        if not series or not series[-2]:
+            return None
+        rank = q * series[-2]
+        for bound, count in zip(self.buckets, series):
+            if count >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        return [
+            {
+                "labels": dict(key),
+                "count": series[-2],
+                "sum": round(series[-1], 6),
+                "p50": self.quantile(0.5, **dict(key)),
+                "p99": self.quantile(0.99, **dict(key)),
+            }
+            for key, series in self.values.items()
+        ]
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.monotonic() - self.started, **self.labels)
+
+
+class Metrics:
+    """Registry of the process's metrics, rendered for Prometheus or as JSON."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        return {
+            "timestamp": time.time(),
+            "metrics": {
+                name: metric.snapshot() for name, metric in self.metrics.items()
+            },
+        }
+
+
+metrics = Metrics()
+
+REQUEST_SECONDS = metrics.histogram(
+    "scraper_request_seconds", "Duration of HTTP requests, by source and status"
+)
+RESPONSE_BYTES = metrics.counter(
+    "scraper_response_bytes_total", "Bytes of response bodies downloaded"
+)
+PARSE_SECONDS = metrics.histogram(
+    "scraper_parse_seconds", "Time to parse an article page into an item"
+)
+PARSE_ERRORS = metrics.counter(
+    "scraper_parse_errors_total", "Article pages that could not be parsed"
+)
+DEDUP_HITS = metrics.counter(
+    "scraper_dedup_hits_total", "Article URLs skipped because already processed"
+)
+QUEUE_DEPTH = metrics.gauge("storage_queue_depth", "Items waiting in the storage queue")
+BATCH_SECONDS = metrics.histogram(
+    "storage_batch_seconds", "Time to write one batch of articles"
+)
+ROWS_WRITTEN = metrics.counter(
+    "storage_rows_total", "Article rows inserted, updated, or ignored as already stored"
+)
+DUPLICATES = metrics.counter(
+    "storage_duplicates_total", "New articles whose body duplicates a stored one"
+)
+BODY_BYTES = metrics.counter(
+    "storage_body_bytes_total", "Article body bytes before and after compression"
+)
+SHARD_ITEMS = metrics.counter(
+    "orchestrator_shard_items_total",
+    "Articles, checkpoints and done article jobs received from each shard process",
+)
+
+
+class MetricsExporter:
+    """Serves the registry over HTTP and/or writes it periodically as JSON.
+
+    GET /metrics returns the Prometheus text format and GET /metrics.json the
+    JSON snapshot.
+    """
+
+    def __init__(self, registry=metrics, port=None, json_path=None, interval=30.0):
+        self.registry = registry
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval
+        self.server = None
+        self.task = None
+
+    async def start(self):
+        if self.port is not None:
+            self.server = await asyncio.start_server(self.handle, port=self.port)
+            ScraperLogger.log_info(f"Serving metrics on port {self.port}")
+        if self.json_path is not None:
+            self.task = asyncio.create_task(self.write_periodically())
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            # Last snapshot covers the end of the run
+            self.write_snapshot()
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            path = parts[1] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                status, content_type = "200 OK", "text/plain; version=0.0.4"
+                body = self.registry.render_prometheus().encode()
+            elif path == "/metrics.json":
+                status, content_type = "200 OK", "application/json"
+                body = json.dumps(self.registry.snapshot()).encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b""
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def write_snapshot(self):
+        with open(self.json_path, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+
+    async def write_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write_snapshot()
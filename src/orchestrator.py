@@ -0,0 +1,517 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .date_parser import date_parse_stats
+from .http_cache import HttpCache
+from .job_table import create_job_table
+from .metrics import SHARD_ITEMS
+from .page_archive import PageArchive
+from .scraper_logger import ScraperLogger
+from .scrapers.anacao_scraper import AnacaoScraper
+from .scrapers.expressodasilhas_scraper import ExpressDasIlhasScraper
+from .scrapers.santiagomagazine_scraper import SantiagoMagazineScraper
+from .storage_worker import SENTINEL, StorageWorker
+
+# Every scraper the orchestrator can run, by source name
+SCRAPERS = {
+    scraper.source: scraper
+    for scraper in (AnacaoScraper, ExpressDasIlhasScraper, SantiagoMagazineScraper)
+}
+
+# Default capacity of the storage queue, in parsed articles
+STORAGE_QUEUE_SIZE = 1000
+
+# Sent by a shard process once it has nothing more to send
+SHARD_DONE = "SHARD_DONE"
+
+
+def section_name(start_url):
+    """Name of the section a start URL lists, e.g. "politica" for
+    "/categoria/politica/"."""
+    return start_url.strip("/").rsplit("/", 1)[-1]
+
+
+class ShardQueue:
+    """Stands in for the storage queue in a shard process: items are sent to
+    the writer's process over a multiprocessing queue, tagged with the shard.
+
+    put() waits in a thread while the queue is full, so a writer that falls
+    behind slows the shards down as it does in-process scrapers.
+    """
+
+    def __init__(self, ipc_queue, shard):
+        self.ipc_queue = ipc_queue
+        self.shard = shard
+
+    async def put(self, item):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.ipc_queue.put, (self.shard, item))
+
+
+def run_shard(shard, options, ipc_queue):
+    """Entry point of a shard process: crawl the shard's sections, sending the
+    items to the writer's process."""
+    # Out of the terminal's process group: Ctrl-C reaches the parent only,
+    # which passes stop requests on to the shards
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    # The shard's copy of the proxy pool, whose stats go back to the parent
+    proxy_pool = options.get("proxy_pool")
+    since = proxy_pool.counts() if proxy_pool is not None else None
+    try:
+        orchestrator = Orchestrator(
+            storage_queue=ShardQueue(ipc_queue, shard), **options
+        )
+        asyncio.run(orchestrator.run())
+    finally:
+        if proxy_pool is not None:
+            stats = {"type": "proxies", "stats": proxy_pool.snapshot(), "since": since}
+            ipc_queue.put((shard, stats))
+        ipc_queue.put((shard, SHARD_DONE))
+
+
+class Orchestrator:
+    """Runs the selected scrapers side by side against one storage pipeline.
+
+    Every scraper puts its articles on the same bounded queue, drained by a
+    single StorageWorker, so there is one writer to the database however many
+    sites are crawled. sites and sections restrict the crawl to those source
+    and section names (None selects all of them); base_urls maps a source to
+    the address it is scraped from instead of its default one.
+
+    The queue holds at most queue_size parsed articles: when the writer falls
+    behind, scrapers wait on it instead of piling articles up in memory.
+
+    page_archive names a directory to archive the fetched article pages in
+    (see src/page_archive.py).
+
+    With shards above 1 the (source, section) pairs are split across that many
+    processes, each crawling its share with its own event loop and parse work,
+    while this process runs the writer and reports each shard's progress every
+    progress_interval seconds. A site crawled by several shards has its request
+    rate split between them, as are the parse_workers of a process executor,
+    and the shards' proxy stats are added to the proxy_pool given here.
+
+    job_table names a job table shared with runners on other machines (see
+    src/job_table.py): the listing pages and articles of the job_run are
+    claimed from it under leases of lease_seconds, so that the runners split
+    the crawl between them instead of each crawling every section. The request
+    rates are then those of all the runners together, each taking its share.
+    """
+
+    def __init__(
+        self,
+        database_path="scraper_database.db",
+        sites=None,
+        sections=None,
+        base_urls=None,
+        queue_size=STORAGE_QUEUE_SIZE,
+        batch_size=200,
+        flush_interval=2.0,
+        body_codec=None,
+        dedup="flag",
+        page_archive=None,
+        shards=1,
+        progress_interval=30.0,
+        job_table=None,
+        job_backend="sqlite",
+        job_run=None,
+        lease_seconds=60.0,
+        start_urls=None,
+        rate_shares=None,
+        storage_queue=None,
+        **scraper_options,
+    ):
+        unknown = set(sites or ()) - set(SCRAPERS)
+        if unknown:
+            raise ValueError(f"Unknown sites: {', '.join(sorted(unknown))}")
+
+        self.database_path = database_path
+        self.sites = list(sites or SCRAPERS)
+        self.sections = set(sections) if sections else None
+        self.base_urls = base_urls or {}
+        self.scraper_options = scraper_options
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.body_codec = body_codec
+        self.dedup = dedup
+        self.page_archive = page_archive
+        self.shards = shards
+        self.progress_interval = progress_interval
+        self.job_table = job_table
+        self.job_backend = job_backend
+        self.job_run = job_run
+        self.lease_seconds = lease_seconds
+        # Set for shard processes: the exact start URLs of each source, the
+        # number of shards sharing each source's rate, and the queue to the
+        # writer, which runs in the parent process
+        self.shard_start_urls = start_urls
+        self.rate_shares = rate_shares or {}
+        self.writes = storage_queue is None
+        self.storage_queue = storage_queue or asyncio.Queue(maxsize=queue_size)
+        self.stopping = False
+
+    def start_urls(self, scraper_class):
+        if self.shard_start_urls is not None:
+            return list(self.shard_start_urls.get(scraper_class.source, ()))
+        return [
+            start_url
+            for start_url in scraper_class.default_start_urls
+            if self.sections is None or section_name(start_url) in self.sections
+        ]
+
+    def build_scrapers(self, **options):
+        scrapers = []
+        for source in self.sites:
+            scraper_class = SCRAPERS[source]
+            start_urls = self.start_urls(scraper_class)
+            if not start_urls:
+                if self.shard_start_urls is None:
+                    ScraperLogger.log_warning(f"No selected sections on {source}")
+                continue
+            scraper = scraper_class(
+                base_url=self.base_urls.get(source, scraper_class.default_base_url),
+                start_urls=start_urls,
+                storage_queue=self.storage_queue,
+                database_path=self.database_path,
+                **options,
+            )
+            # With a job table, shards are runners of it like any other and
+            # split the rates by the number of runners instead
+            share = self.rate_shares.get(source, 1) if self.job_table is None else 1
+            scraper.requests_per_second /= share
+            scraper.max_requests_per_second /= share
+            scrapers.append(scraper)
+        return scrapers
+
+    def plan_shards(self):
+        """Split the selected (source, section) pairs across the shards, as a
+        {source: [start_url, ...]} mapping per shard. Pairs are dealt out in
+        turn, so shards get as many sections each and every site is spread
+        across them."""
+        pairs = [
+            (source, start_url)
+            for source in self.sites
+            for start_url in self.start_urls(SCRAPERS[source])
+        ]
+        plans = [{} for _ in range(min(self.shards, len(pairs)))]
+        for index, (source, start_url) in enumerate(pairs):
+            plans[index % len(plans)].setdefault(source, []).append(start_url)
+        return plans
+
+    def stop(self, scrapers, crawl):
+        """Handle SIGINT/SIGTERM: the first one lets the pages in progress finish
+        and their articles drain to the database, a second one stops at once."""
+        if not self.stopping:
+            self.stopping = True
+            ScraperLogger.log_warning(
+                "Stopping: finishing pages in progress (signal again to stop now)"
+            )
+            for scraper in scrapers:
+                scraper.stop()
+        else:
+            ScraperLogger.log_warning("Stopping now")
+            crawl.cancel()
+
+    def add_signal_handlers(self, handler, *args):
+        loop = asyncio.get_running_loop()
+        signals = []
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, handler, *args)
+                signals.append(signum)
+            except (NotImplementedError, RuntimeError):
+                # No loop signal handlers on Windows or outside the main thread
+                pass
+        return signals
+
+    def remove_signal_handlers(self, signals):
+        loop = asyncio.get_running_loop()
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+
+    async def start_writer(self, job_table=None):
+        storage_worker = StorageWorker(
+            self.storage_queue,
+            self.database_path,
+            batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+            body_codec=self.body_codec,
+            dedup=self.dedup,
+            job_table=job_table,
+        )
+        writer = asyncio.create_task(storage_worker.run())
+        # Scrapers load the stored links at startup, so create the schema first
+        ready = asyncio.create_task(storage_worker.ready.wait())
+        await asyncio.wait((writer, ready), return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            ready.cancel()
+            writer.result()
+        return writer
+
+    async def stop_writer(self, writer):
+        # Everything queued before the sentinel is written before the worker
+        # exits, so stopping never loses an article that was already parsed
+        if not writer.done():
+            await self.storage_queue.put(SENTINEL)
+            await writer
+
+    async def run(self):
+        if self.shards > 1:
+            await self.run_shards()
+            return
+
+        options = dict(self.scraper_options)
+        # One parse pool for all the sites rather than one each. Its processes
+        # ignore SIGINT, which the terminal sends to them as well, so that
+        # stopping is left to the orchestrator.
+        executor = None
+        parse_workers = options.pop("parse_workers", None)
+        if options.get("parse_executor") == "process":
+            executor = ProcessPoolExecutor(
+                max_workers=parse_workers,
+                initializer=signal.signal,
+                initargs=(signal.SIGINT, signal.SIG_IGN),
+            )
+        elif options.get("parse_executor") == "thread":
+            executor = ThreadPoolExecutor(max_workers=parse_workers)
+        if executor is not None:
+            options["parse_executor"] = executor
+
+        options["fingerprint_bodies"] = self.dedup != "off"
+        archive = None
+        if self.page_archive is not None:
+            archive = PageArchive(self.page_archive)
+            options["page_archive"] = archive
+        # One HTTP cache connection for all the sites, so that their writes to
+        # the cache file do not contend with each other
+        cache = None
+        if options.get("http_cache") is not None:
+            cache = HttpCache(
+                options.pop("http_cache"),
+                options.pop("cache_ttl", 7 * 24 * 3600),
+                options.pop("cache_max_bytes", 512 * 1024 * 1024),
+            )
+            options["http_cache"] = cache
+        jobs = None
+        if self.job_table is not None:
+            jobs = create_job_table(
+                self.job_table,
+                self.job_backend,
+                run=self.job_run,
+                lease_seconds=self.lease_seconds,
+            )
+            options["job_table"] = jobs
+        scrapers = self.build_scrapers(**options)
+        ScraperLogger.log_info(
+            f"Crawling {', '.join(scraper.source for scraper in scrapers)}"
+        )
+
+        if cache is not None:
+            await cache.open()
+        leases = None
+        if jobs is not None:
+            await jobs.open()
+            leases = asyncio.create_task(jobs.renew_leases())
+        # A shard's writer runs in the parent process
+        writer = await self.start_writer(jobs) if self.writes else None
+        crawl = asyncio.ensure_future(
+            asyncio.gather(*(scraper.run() for scraper in scrapers))
+        )
+        signals = self.add_signal_handlers(self.stop, scrapers, crawl)
+
+        try:
+            if writer is not None:
+                # A writer that fails would leave the scrapers blocked on a full
+                # queue
+                await asyncio.wait((crawl, writer), return_when=asyncio.FIRST_COMPLETED)
+                if writer.done():
+                    crawl.cancel()
+                    await asyncio.gather(crawl, return_exceptions=True)
+                    writer.result()
+            try:
+                await crawl
+            except asyncio.CancelledError:
+                if not self.stopping:
+                    raise
+        finally:
+            if writer is not None:
+                await self.stop_writer(writer)
+            self.remove_signal_handlers(signals)
+            if executor is not None:
+                executor.shutdown()
+            # Counted per process (parse workers included), not per site
+            sources = ", ".join(scraper.source for scraper in scrapers)
+            ScraperLogger.log_info(
+                f"Date parsing across {sources}: {date_parse_stats()}"
+            )
+            if archive is not None:
+                archive.close()
+            if cache is not None:
+                await cache.close()
+            if jobs is not None:
+                leases.cancel()
+                ScraperLogger.log_info(f"Jobs of run {jobs.run}: {await jobs.counts()}")
+                await jobs.close()
+
+    def shard_options(self, plan, rate_shares, shards):
+        options = dict(self.scraper_options)
+        if options.get("parse_executor") == "process":
+            # Each shard has its own pool: together they start parse_workers
+            # processes (the CPU count by default), not that many per shard
+            parse_workers = options.get("parse_workers") or os.cpu_count() or 1
+            options["parse_workers"] = max(parse_workers // shards, 1)
+        return {
+            "database_path": self.database_path,
+            "sites": list(plan),
+            "base_urls": self.base_urls,
+            "dedup": self.dedup,
+            "page_archive": self.page_archive,
+            "job_table": self.job_table,
+            "job_backend": self.job_backend,
+            "job_run": self.job_run,
+            "lease_seconds": self.lease_seconds,
+            "start_urls": plan,
+            "rate_shares": rate_shares,
+            **options,
+        }
+
+    def stop_shards(self, processes):
+        """Handle SIGINT/SIGTERM in sharded mode by passing the signal on to the
+        shards as SIGTERM: the first one lets them finish the pages in
+        progress, a second one stops them at once."""
+        ScraperLogger.log_warning(
+            "Stopping shards: finishing pages in progress (signal again to stop now)"
+            if not self.stopping
+            else "Stopping shards now"
+        )
+        self.stopping = True
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    async def run_shards(self):
+        plans = self.plan_shards()
+        rate_shares = {}
+        for plan in plans:
+            for source in plan:
+                rate_shares[source] = rate_shares.get(source, 0) + 1
+
+        # The writer marks the shards' article jobs done once stored
+        jobs = None
+        if self.job_table is not None:
+            jobs = create_job_table(self.job_table, self.job_backend, run=self.job_run)
+            await jobs.open()
+            # Shards share this process's run, even if the day changes while
+            # they start
+            self.job_run = jobs.run
+        writer = await self.start_writer(jobs)
+        # Spawned rather than forked, so shards do not inherit this process's
+        # event loop and threads
+        context = multiprocessing.get_context("spawn")
+        ipc_queue = context.Queue(maxsize=self.queue_size)
+        processes = [
+            context.Process(
+                target=run_shard,
+                args=(
+                    shard,
+                    self.shard_options(plan, rate_shares, len(plans)),
+                    ipc_queue,
+                ),
+                name=f"shard-{shard}",
+            )
+            for shard, plan in enumerate(plans)
+        ]
+        for shard, (process, plan) in enumerate(zip(processes, plans)):
+            process.start()
+            sections = ", ".join(
+                f"{source} {' '.join(map(section_name, start_urls))}"
+                for source, start_urls in plan.items()
+            )
+            ScraperLogger.log_info(f"Shard {shard}: {sections}")
+        signals = self.add_signal_handlers(self.stop_shards, processes)
+
+        progress = [
+            {
+                "articles": 0,
+                "sections": sum(map(len, plan.values())),
+                "sections_done": 0,
+                "done": False,
+            }
+            for plan in plans
+        ]
+        started = time.monotonic()
+        try:
+            await self.collect_shards(ipc_queue, processes, progress, writer)
+        except BaseException:
+            # Nothing reads the shards' items any more
+            for process in processes:
+                process.kill()
+            raise
+        finally:
+            await self.stop_writer(writer)
+            if jobs is not None:
+                await jobs.close()
+            self.remove_signal_handlers(signals)
+            for process in processes:
+                process.join()
+            self.report_progress(progress, started)
+
+    async def collect_shards(self, ipc_queue, processes, progress, writer):
+        """Pass the shards' items on to the writer until every shard is done."""
+        loop = asyncio.get_running_loop()
+        next_report = time.monotonic() + self.progress_interval
+        while not all(shard["done"] for shard in progress):
+            if writer.done():
+                writer.result()
+            if time.monotonic() >= next_report:
+                self.report_progress(progress)
+                next_report += self.progress_interval
+
+            try:
+                shard, item = await loop.run_in_executor(None, ipc_queue.get, True, 0.5)
+            except queue.Empty:
+                # A shard killed before it could say it was done
+                for index, process in enumerate(processes):
+                    if not process.is_alive() and not progress[index]["done"]:
+                        ScraperLogger.log_error(
+                            f"Shard {index} exited with code {process.exitcode}"
+                        )
+                        progress[index]["done"] = True
+                continue
+
+            if item == SHARD_DONE:
+                progress[shard]["done"] = True
+                continue
+            if item.get("type") == "proxies":
+                self.scraper_options["proxy_pool"].merge(item["stats"], item["since"])
+                continue
+            if item.get("type") == "checkpoint":
+                progress[shard]["sections_done"] += item["done"]
+                SHARD_ITEMS.inc(shard=shard, kind="checkpoint")
+            elif item.get("type") == "job":
+                SHARD_ITEMS.inc(shard=shard, kind="job")
+            else:
+                progress[shard]["articles"] += 1
+                SHARD_ITEMS.inc(shard=shard, kind="article")
+            await self.storage_queue.put(item)
+
+    def report_progress(self, progress, started=None):
+        for shard, counts in enumerate(progress):
+            state = "done" if counts["done"] else "running"
+            ScraperLogger.log_info(
+                f"Shard {shard}: {counts['articles']} articles, "
+                f"{counts['sections_done']}/{counts['sections']} sections ({state})"
+            )
+        if started is not None:
+            articles = sum(counts["articles"] for counts in progress)
+            ScraperLogger.log_info(
+                f"Shards done: {articles} articles in "
+                f"{time.monotonic() - started:.1f}s"
+            )
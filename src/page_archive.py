@@ -0,0 +1,167 @@
+"""Append-only archive of the article pages fetched by the scrapers.
+
+Pages are written as WARC/1.0 response records, each its own gzip member, to
+segment files named pages-<started>-<pid>-<n>.warc.gz. A run opens new
+segments rather than appending to old ones, and a segment is closed once it
+reaches segment_bytes. Bodies are stored decoded, so the Content-Encoding of
+the original response is dropped from the archived headers.
+
+The archive lets articles be parsed again without the network, see
+src/reparse.py.
+"""
+
+import glob
+import gzip
+import os
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from httpx import Response
+
+from .scraper_logger import ScraperLogger
+
+# Describe the archived body rather than the transfer of the original one
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+class ArchivedPage:
+    def __init__(self, source, url, date, status_code, headers, content):
+        self.source = source
+        self.url = url
+        self.date = date
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        # Decoded the way the scrapers decoded the live response
+        return Response(
+            self.status_code, headers=self.headers, content=self.content
+        ).text
+
+
+class PageArchive:
+    """Writes fetched pages to gzip-compressed WARC segments in directory.
+
+    write() blocks on compression and disk, so scrapers call it in a thread;
+    one archive can be shared by all of them.
+    """
+
+    def __init__(self, directory, segment_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.started = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.lock = threading.Lock()
+        self.file = None
+        self.segments = 0
+        self.records = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def open_segment(self):
+        path = os.path.join(
+            self.directory,
+            f"pages-{self.started}-{os.getpid()}-{self.segments:05d}.warc.gz",
+        )
+        self.segments += 1
+        # "x" so that an existing segment is never overwritten
+        self.file = open(path, "xb")
+
+    def write(self, source, url, response):
+        headers = "".join(
+            f"{name}: {value}\r\n"
+            for name, value in response.headers.items()
+            if name.lower() not in DROPPED_HEADERS
+        )
+        http = (
+            f"HTTP/1.1 {response.status_code} {response.reason_phrase}\r\n"
+            f"{headers}\r\n"
+        ).encode("latin-1") + response.content
+        warc_headers = (
+            "WARC/1.0\r\n"
+            "WARC-Type: response\r\n"
+            f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>\r\n"
+            f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            f"WARC-Source: {source}\r\n"
+            "Content-Type: application/http; msgtype=response\r\n"
+            f"Content-Length: {len(http)}\r\n\r\n"
+        ).encode("utf-8")
+        # Each record is a gzip member of its own, so a segment cut short by a
+        # crash only loses its last record
+        record = gzip.compress(warc_headers + http + b"\r\n\r\n")
+
+        with self.lock:
+            if self.file is None:
+                self.open_segment()
+            self.file.write(record)
+            self.records += 1
+            if self.file.tell() >= self.segment_bytes:
+                self.file.close()
+                self.file = None
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        ScraperLogger.log_info(
+            f"Archived {self.records} pages in {self.segments} segments "
+            f"under {self.directory}"
+        )
+
+
+def read_headers(stream):
+    """Header lines up to the next blank line, as a list of (name, value)."""
+    headers = []
+    while True:
+        line = stream.readline()
+        if not line:
+            raise EOFError("Truncated record")
+        line = line.rstrip(b"\r\n")
+        if not line:
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers.append((name.strip(), value.strip()))
+
+
+def read_segment(path):
+    """Yield the ArchivedPage records of one segment, in the order written."""
+    with gzip.open(path, "rb") as stream:
+        while True:
+            try:
+                version = stream.readline()
+                if not version:
+                    return
+                fields = dict(read_headers(stream))
+                payload = stream.read(int(fields["Content-Length"]))
+                stream.read(4)
+            except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+                ScraperLogger.log_warning(f"Stopped reading {path}: {e}")
+                return
+            if fields.get("WARC-Type") != "response":
+                continue
+
+            head, _, content = payload.partition(b"\r\n\r\n")
+            status_line, *header_lines = head.split(b"\r\n")
+            headers = [
+                tuple(part.strip() for part in line.decode("latin-1").split(":", 1))
+                for line in header_lines
+            ]
+            yield ArchivedPage(
+                fields.get("WARC-Source"),
+                fields["WARC-Target-URI"],
+                fields.get("WARC-Date"),
+                int(status_line.split()[1]),
+                headers,
+                content,
+            )
+
+
+def read_archive(directory):
+    """Yield every archived page under directory, oldest segment first, so a
+    page fetched again comes after its earlier copies."""
+    for path in sorted(glob.glob(os.path.join(directory, "pages-*.warc.gz"))):
+        yield from read_segment(path)
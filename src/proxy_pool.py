@@ -0,0 +1,244 @@
+import asyncio
+import json
+import random
+import time
+
+from httpx import AsyncClient, AsyncHTTPTransport, RequestError
+
+from .scraper_logger import ScraperLogger
+
+# Responses that count against the proxy rather than the site: it refused our
+# credentials, or it is dead or overloaded and answered for the site itself
+PROXY_FAILURE_STATUSES = {407, 502, 503, 504}
+
+# Public proxies the scrapers used to ship with, selected with PROXIES=default
+DEFAULT_PROXIES = (
+    "http://18.230.20.205:3128",
+    "http://139.59.1.14:8080",
+    "http://8.219.43.134:8118",
+    "http://162.223.94.164:80",
+    "http://54.38.181.125:80",
+    "http://162.223.94.163:80",
+    "http://193.15.14.198:80",
+    "http://8.219.169.172:3132",
+    "http://139.162.78.109:3128",
+    "http://20.210.113.32:80",
+    "http://20.24.43.214:80",
+    "http://20.206.106.192:80",
+    "http://47.56.110.204:8989",
+    "http://162.248.225.130:80",
+    "http://162.248.225.11:80",
+    "http://198.199.86.11:3128",
+    "http://52.117.157.155:8002",
+    "http://162.223.116.54:80",
+    "http://162.248.225.198:80",
+    "http://103.83.179.180:3125",
+    "http://114.231.46.31:8089",
+    "http://202.12.80.6:82",
+    "http://202.12.80.8:82",
+    "http://119.2.52.152:8282",
+    "http://45.174.248.19:999",
+    "http://79.110.197.144:8081",
+    "http://183.230.162.122:9091",
+    "http://181.209.111.146:999",
+    "http://114.103.88.224:8089",
+    "http://185.194.11.180:8080",
+    "http://111.72.198.123:8089",
+    "http://103.158.220.2:83",
+    "http://103.31.232.174:8080",
+    "http://186.125.218.147:999",
+    "http://114.231.46.237:8089",
+    "http://154.64.215.132:999",
+    "http://213.207.195.181:8080",
+    "http://154.73.29.201:8080",
+    "http://154.73.28.193:8080",
+    "http://95.142.223.24:56379",
+    "http://193.239.58.92:8081",
+    "http://102.214.106.86:1975",
+    "http://115.42.45.1:80",
+    "http://77.119.250.129:8080",
+)
+
+
+class ProxyStats:
+    def __init__(self, url):
+        self.url = url
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        # Exponentially weighted moving average of response time, in seconds
+        self.latency = None
+        self.evicted = False
+
+    def record(self, ok, latency=None):
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+
+    @property
+    def success_rate(self):
+        # Laplace smoothing: an untried proxy starts at 0.5, not 0 or 1
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def score(self):
+        return self.success_rate / max(self.latency or 1.0, 0.05)
+
+    def snapshot(self):
+        return {
+            "proxy": self.url,
+            "successes": self.successes,
+            "failures": self.failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency": round(self.latency, 3) if self.latency is not None else None,
+            "evicted": self.evicted,
+        }
+
+
+class ProxyPool:
+    """Rotates requests across proxies, favouring the fast and reliable ones.
+
+    Each request picks a healthy proxy at random, weighted by its success rate
+    over its average latency. A proxy failing max_failures times in a row is
+    evicted for the rest of the run; when none is left, requests go direct.
+    """
+
+    def __init__(
+        self,
+        proxies,
+        max_failures=3,
+        check_url="http://www.gstatic.com/generate_204",
+        check_timeout=10,
+    ):
+        self.proxies = {url: ProxyStats(url) for url in dict.fromkeys(proxies)}
+        self.max_failures = max_failures
+        self.check_url = check_url
+        self.check_timeout = check_timeout
+
+    @classmethod
+    def from_config(cls, config, path=None):
+        """Build a pool from a proxy file or the PROXY_FILE/PROXIES settings.
+
+        Files hold one proxy URL per line; PROXIES is a comma-separated list,
+        or "default" for DEFAULT_PROXIES. Returns None when nothing is set.
+        """
+        path = path or config.get("PROXY_FILE")
+        if path:
+            with open(path) as f:
+                proxies = [
+                    line.strip()
+                    for line in f
+                    if line.strip() and not line.startswith("#")
+                ]
+        elif config.get("PROXIES") == "default":
+            proxies = DEFAULT_PROXIES
+        elif config.get("PROXIES"):
+            proxies = [p.strip() for p in config["PROXIES"].split(",") if p.strip()]
+        else:
+            return None
+
+        options = {}
+        if config.get("PROXY_CHECK_URL"):
+            options["check_url"] = config["PROXY_CHECK_URL"]
+        return cls(proxies, **options)
+
+    def healthy(self):
+        return [stats for stats in self.proxies.values() if not stats.evicted]
+
+    def choose(self):
+        """Pick the proxy for the next request, or None to connect directly."""
+        healthy = self.healthy()
+        if not healthy:
+            return None
+        return random.choices(healthy, weights=[s.score for s in healthy])[0].url
+
+    def report(self, proxy, ok, latency=None):
+        stats = self.proxies.get(proxy)
+        if stats is None or stats.evicted:
+            return
+
+        stats.record(ok, latency)
+        if stats.consecutive_failures >= self.max_failures:
+            stats.evicted = True
+            ScraperLogger.log_warning(
+                f"Evicted proxy {proxy} after {stats.consecutive_failures} failures "
+                f"({len(self.healthy())} left)"
+            )
+
+    async def check(self, proxy):
+        transport = AsyncHTTPTransport(proxy=proxy)
+        async with AsyncClient(
+            mounts={"all://": transport}, timeout=self.check_timeout
+        ) as client:
+            started = time.monotonic()
+            try:
+                resp = await client.get(self.check_url)
+                ok = resp.status_code < 400
+            except RequestError:
+                ok = False
+            self.report(proxy, ok, time.monotonic() - started if ok else None)
+
+    async def health_check(self, concurrency=20):
+        """Probe every proxy concurrently and evict the ones that fail."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check(proxy):
+            async with semaphore:
+                await self.check(proxy)
+
+        # A single failed probe is enough to leave a proxy out of the run
+        max_failures, self.max_failures = self.max_failures, 1
+        try:
+            await asyncio.gather(*(check(proxy) for proxy in self.proxies))
+        finally:
+            self.max_failures = max_failures
+
+        ScraperLogger.log_info(
+            f"{len(self.healthy())}/{len(self.proxies)} proxies passed the health check"
+        )
+
+    def counts(self):
+        return {url: (s.successes, s.failures) for url, s in self.proxies.items()}
+
+    def merge(self, snapshot, since=None):
+        """Add the requests recorded by a copy of this pool (in a shard process)
+        to its stats, from the copy's snapshot(). since holds the copy's counts()
+        from when it was made, which this pool already has."""
+        since = since or {}
+        for entry in snapshot:
+            stats = self.proxies.get(entry["proxy"])
+            if stats is None:
+                continue
+            successes_before, failures_before = since.get(entry["proxy"], (0, 0))
+            successes = entry["successes"] - successes_before
+            failures = entry["failures"] - failures_before
+            if successes > 0 and entry["latency"] is not None:
+                if stats.latency is None:
+                    stats.latency = entry["latency"]
+                else:
+                    # Averaged by the successes, the requests it was timed on
+                    stats.latency = (
+                        stats.latency * stats.successes + entry["latency"] * successes
+                    ) / (stats.successes + successes)
+            stats.successes += successes
+            stats.failures += failures
+            stats.evicted = stats.evicted or entry["evicted"]
+
+    def snapshot(self):
+        return sorted(
+            (stats.snapshot() for stats in self.proxies.values()),
+            key=lambda s: (s["evicted"], s["latency"] or float("inf")),
+        )
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
@@ -0,0 +1,143 @@
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Statuses worth retrying: the server is overloaded or a gateway failed
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostRateLimiter:
+    """Token bucket for one host whose rate adapts to how the host responds.
+
+    The rate grows additively while responses come back faster than
+    target_latency, and is cut multiplicatively when slow responses and errors
+    make up error_threshold of the last window responses (AIMD), so concurrent
+    fetchers converge on what the host can sustain. Once cut, the window starts
+    over: a burst of failures among requests in flight cuts the rate once, and
+    occasional errors of a healthy host do not cut it at all.
+    """
+
+    def __init__(
+        self,
+        rate=4.0,
+        min_rate=0.5,
+        max_rate=20.0,
+        burst=4,
+        target_latency=2.0,
+        increase=0.25,
+        decrease=0.5,
+        window=20,
+        error_threshold=0.3,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        # Runners sending to the host, which the rates are split between
+        self.shares = 1
+        self.error_threshold = error_threshold
+        # True for each error or slow response among the last window
+        self.outcomes = deque(maxlen=window)
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(
+                    self.tokens + (now - self.updated) * self.rate, self.burst
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def split(self, shares):
+        """Scale the rates for shares runners sending to the host."""
+        if shares != self.shares:
+            scale = self.shares / shares
+            self.rate = max(self.rate * scale, self.min_rate)
+            self.max_rate = max(self.max_rate * scale, self.min_rate)
+            self.shares = shares
+
+    def on_success(self, latency):
+        if latency <= self.target_latency:
+            self.outcomes.append(False)
+            self.rate = min(self.rate + self.increase, self.max_rate)
+        else:
+            self.congested((1 + self.decrease) / 2)
+
+    def on_error(self, retry_after=None):
+        self.congested(self.decrease)
+        if retry_after:
+            # The host asked for a break: hold every request to it until then
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def congested(self, factor):
+        self.outcomes.append(True)
+        if sum(self.outcomes) >= self.error_threshold * self.outcomes.maxlen:
+            self.rate = max(self.rate * factor, self.min_rate)
+            self.outcomes.clear()
+
+
+class RetryBudget:
+    """Process-wide allowance of retries.
+
+    Every first attempt deposits ratio tokens and every retry spends one, so
+    retries stay a bounded fraction of traffic instead of multiplying load on a
+    failing site. min_tokens lets a run that starts on errors still retry.
+    """
+
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self):
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+retry_budget = RetryBudget()
+
+
+def backoff_delay(retries, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**retries))
+
+
+def parse_retry_after(value, cap=300.0):
+    """Seconds to wait from a Retry-After header, in seconds or HTTP-date form."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        seconds = (date - datetime.now(timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), cap)
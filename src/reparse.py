@@ -0,0 +1,161 @@
+"""Parse archived article pages again, without the network.
+
+After a fix to a site's article_parser, ``python -m src.reparse --archive DIR``
+streams the pages archived with ``--page-archive DIR`` through the parsers in a
+process pool and stores the results, replacing the articles already stored.
+Pages are read and parsed a few chunks at a time, so memory stays flat however
+large the archive is. When a page was archived more than once, its latest copy
+wins.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .base_scraper import parse_and_fingerprint
+from .orchestrator import SCRAPERS, STORAGE_QUEUE_SIZE
+from .page_archive import read_archive
+from .scraper_logger import ScraperLogger
+from .search import rebuild
+from .storage_worker import SENTINEL, StorageWorker
+
+
+def parse_pages(pages, fingerprint_bodies):
+    """Parse a chunk of ArchivedPages in a worker process. Returns the items
+    and the URLs that failed to parse."""
+    items, failed = [], []
+    for page in pages:
+        article_parser = SCRAPERS[page.source].article_parser
+        try:
+            if fingerprint_bodies:
+                item = parse_and_fingerprint(article_parser, page.url, page.text)
+            else:
+                item = article_parser(page.url, page.text)
+        except Exception as e:
+            failed.append((page.url, str(e)))
+            continue
+        items.append(item)
+    return items, failed
+
+
+async def reparse(
+    archive,
+    database_path="scraper_database.db",
+    sources=None,
+    workers=None,
+    chunk_size=50,
+    batch_size=200,
+    body_codec=None,
+    dedup="flag",
+):
+    storage_queue = asyncio.Queue(maxsize=STORAGE_QUEUE_SIZE)
+    storage_worker = StorageWorker(
+        storage_queue,
+        database_path,
+        batch_size=batch_size,
+        body_codec=body_codec,
+        dedup=dedup,
+        upsert=True,
+    )
+    writer = asyncio.create_task(storage_worker.run())
+
+    pages = (
+        page
+        for page in read_archive(archive)
+        if page.source in SCRAPERS and (sources is None or page.source in sources)
+    )
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # Enough chunks in flight to keep every worker busy; results are taken in
+    # archive order so later copies of a page are stored last
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    in_flight = deque()
+    parsed, failed = 0, 0
+    try:
+        while True:
+            chunk = await asyncio.to_thread(list, itertools.islice(pages, chunk_size))
+            if chunk:
+                in_flight.append(
+                    loop.run_in_executor(executor, parse_pages, chunk, dedup != "off")
+                )
+            if not in_flight:
+                break
+            if chunk and len(in_flight) < max_in_flight:
+                continue
+
+            items, failures = await in_flight.popleft()
+            for url, error in failures:
+                ScraperLogger.log_error(f"Error parsing article {url}: {error}")
+            for item in items:
+                if writer.done():
+                    writer.result()
+                await storage_queue.put(item)
+            parsed += len(items)
+            failed += len(failures)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if not writer.done():
+            await storage_queue.put(SENTINEL)
+        await writer
+
+    ScraperLogger.log_info(f"Parsed {parsed} archived pages, {failed} failed")
+    # Replaced articles still have their old text in the search index
+    await asyncio.to_thread(rebuild_index, database_path)
+
+
+def rebuild_index(database_path):
+    with sqlite3.connect(database_path) as conn:
+        rebuild(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse archived article pages again.")
+    parser.add_argument(
+        "--archive", metavar="DIR", required=True, help="directory of the archive"
+    )
+    parser.add_argument("--database", default="scraper_database.db")
+    parser.add_argument(
+        "--sites",
+        nargs="+",
+        choices=sorted(SCRAPERS),
+        default=None,
+        help="only parse pages of these sites",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="parsing processes (defaults to the number of CPUs)",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=50, help="pages sent to a worker at a time"
+    )
+    parser.add_argument(
+        "--body-codec",
+        choices=("zstd", "zlib"),
+        default=None,
+        help="compression of stored article bodies",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=("off", "flag", "skip"),
+        default="flag",
+        help="near-duplicate handling, as for the crawl",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(
+        reparse(
+            args.archive,
+            database_path=args.database,
+            sources=args.sites,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            body_codec=args.body_codec,
+            dedup=args.dedup,
+        )
+    )
@@ -1,102 +1,45 @@
 import asyncio
 
-import aiosqlite
-import dateparser
 from loguru import logger
 from parsel import Selector
 
 from ..base_scraper import BaseScraper
-from ..storage_worker import StorageWorker
+from ..date_parser import parse_date
 from ..utils import normalize_date
 
-SENTINEL = "STOP"
+
+def parse_article_html(page_url, text):
+    """Extract the article item from the HTML of page_url."""
+    html = Selector(text=text)
+    logger.info(f"Parsing article: {page_url}")
+    article_css_selector = """
+        div#content-main p::text,
+        div[dir="auto"] *::text,
+        div.news-details-layout1 p *::text,
+        div#content-main div[style="text-align: justify;"] *::text,
+        div#content-main div::text
+    """
+
+    item = {
+        "source": "anacao",
+        "title": html.css("header#post-header h1::text").get(),
+        "author": html.css("header#post-header span.author-name a::text").get(),
+        "date_pub": normalize_date(
+            parse_date(html.css("time.post-date::text").get(), "anacao")
+        ),
+        "link": page_url,
+        "topic": html.css("header#post-header span::text").get(),
+        "text_html": " <br/> ".join(html.css(article_css_selector).getall()),
+    }
+
+    return item
 
 
 class AnacaoScraper(BaseScraper):
-    def __init__(self, base_url, start_urls, storage_queue, database_path):
-        super().__init__(base_url, start_urls, storage_queue, database_path)
-        self.processed_urls = set()
-        self.source = "anacao"
-
-    async def load_processed_urls(self):
-        async with aiosqlite.connect(self.database_path) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(
-                f"SELECT link FROM articles where source = '{self.source}'"
-            )
-            rows = await cursor.fetchall()
-            self.processed_urls = set(row[0] for row in rows)
-
-    async def parse_page(self, client, page_url):
-        try:
-            await self.load_processed_urls()
-
-            logger.info(f"Parsing page: {page_url}")
-            resp = await self.fetch_page(client, page_url)
-            html = Selector(text=resp.text)
-
-            featured_urls = html.css("div#feat-top-wrap a::attr(href)").getall()
-            urls = (
-                featured_urls
-                + html.css("div#archive-list-wrap li>a::attr(href)").getall()
-            )
-
-            logger.info(
-                f"Found {len(urls)} URLs on page {page_url}"
-            )
-
-            for url in urls:
-                if url not in self.processed_urls:
-                    logger.info(f"Parsing article: {url}")
-                    resp = await self.fetch_page(client, url)
-                    content = Selector(text=resp.text)
-                    await self.parse_article(url, content)
-                    self.processed_urls.add(url)
-                else:
-                    logger.info(f"Skipped existing article: {url}")
-
-            pagination_links = html.css("div.pagination a::attr(href)").getall()
-            if pagination_links:
-                next_page_url = pagination_links[-2]
-                await self.parse_page(client, next_page_url)
-            else:
-                logger.info(f"No next page found on [blue]{page_url}[/blue]")
-
-        except Exception as e:
-            logger.error(f"Error parsing page {page_url}: {e}")
-
-    async def parse_article(self, page_url, html):
-        try:
-            logger.info(f"Parsing article: {page_url}")
-            article_css_selector = """
-                div#content-main p::text,
-                div[dir="auto"] *::text,
-                div.news-details-layout1 p *::text,
-                div#content-main div[style="text-align: justify;"] *::text,
-                div#content-main div::text
-            """
-
-            item = {
-                "source": self.source,
-                "title": html.css("header#post-header h1::text").get(),
-                "author": html.css("header#post-header span.author-name a::text").get(),
-                "date_pub": normalize_date(
-                    dateparser.parse(html.css("time.post-date::text").get())
-                ),
-                "link": page_url,
-                "topic": html.css("header#post-header span::text").get(),
-                "text_html": " <br/> ".join(html.css(article_css_selector).getall()),
-            }
-
-            # Put the item into the storage queue
-            await self.storage_queue.put(item)
-
-        except Exception as e:
-            logger.error(f"Error parsing article {page_url}: {e}")
-
-
-async def main():
-    start_urls_anacao = (
+    source = "anacao"
+    default_base_url = "https://www.anacao.cv"
+    # Section listings the crawl starts from
+    default_start_urls = (
         "/categoria/sociedade/",
         "/categoria/politica/",
         "/categoria/cultura/",
@@ -106,33 +49,38 @@ async def main():
         "/categoria/diaspora/",
         "/categoria/opiniao/",
     )
+    article_parser = staticmethod(parse_article_html)
 
-    # Create an async multiprocessing Queue for inter-process communication
-    storage_queue_anacao = asyncio.Queue()
+    async def parse_page(self, client, page_url, section, cursor=None):
+        logger.info(f"Parsing page: {page_url}")
+        resp = await self.fetch_page(client, page_url)
+        html = Selector(text=resp.text)
 
-    # Start the storage worker processes
-    storage_worker_anacao = StorageWorker(storage_queue_anacao, "scraper_database.db")
+        featured_urls = html.css("div#feat-top-wrap a::attr(href)").getall()
+        urls = (
+            featured_urls + html.css("div#archive-list-wrap li>a::attr(href)").getall()
+        )
 
-    storage_process_anacao = asyncio.create_task(storage_worker_anacao.run())
+        logger.info(f"Found {len(urls)} URLs on page {page_url}")
 
-    # Start the scraper processes
-    scraper_anacao = AnacaoScraper(
-        base_url="https://www.anacao.cv",
-        start_urls=start_urls_anacao,
-        storage_queue=storage_queue_anacao,
-        database_path="scraper_database.db",
-    )
+        new_urls = await self.fetch_articles(client, urls)
+        if not self.keep_paginating(section, new_urls):
+            return
 
-    scraper_process_anacao = asyncio.create_task(scraper_anacao.run())
+        pagination_links = html.css("div.pagination a::attr(href)").getall()
+        if pagination_links:
+            next_page_url = pagination_links[-2]
+            self.schedule_page(next_page_url, section)
+        else:
+            logger.info(f"No next page found on [blue]{page_url}[/blue]")
 
-    # Wait for the scraper processes to finish
-    await asyncio.gather(scraper_process_anacao)
 
-    # Signal the storage workers to exit
-    await storage_queue_anacao.put(SENTINEL)
+async def main(**options):
+    """Scrape this site alone. Takes the options of Orchestrator."""
+    # Imported here because the orchestrator's registry imports this module
+    from ..orchestrator import Orchestrator
 
-    # Wait for the storage worker processes to finish
-    await storage_process_anacao
+    await Orchestrator(sites=(AnacaoScraper.source,), **options).run()
 
 
 if __name__ == "__main__":
@@ -1,108 +1,45 @@
 import asyncio
 import html as hypertext
 
-import aiosqlite
-import dateparser
 from loguru import logger
 from parsel import Selector
 
 from ..base_scraper import BaseScraper
-from ..storage_worker import StorageWorker
+from ..date_parser import parse_date
 from ..utils import normalize_date
 
-SENTINEL = "STOP"
+
+def parse_article_html(page_url, text):
+    """Extract the article item from the HTML of page_url."""
+    html = Selector(text=text)
+    logger.info(f"Parsing article: {page_url}")
+    article_block = html.css("div.news-details-layout1")
+    article_publication = html.css(
+        "div.news-details-layout1 ul.post-info-dark>li>a::text"
+    ).getall()
+
+    item = {
+        "source": "santiagomagazine",
+        "title": article_block.css("h2.title-semibold-dark::text").get(),
+        "author": article_publication[-3],
+        "date_pub": normalize_date(
+            parse_date(article_publication[-1], "santiagomagazine", timezone="UTC-1")
+        ),
+        "link": page_url,
+        "topic": article_block.css("div.topic-box-sm::text").get(),
+        "text_html": hypertext.unescape(
+            " <br/> ".join(article_block.css("blockquote::text,p::text").getall())
+        ),
+    }
+
+    return item
 
 
 class SantiagoMagazineScraper(BaseScraper):
-    def __init__(self, base_url, start_urls, storage_queue, database_path):
-        super().__init__(base_url, start_urls, storage_queue, database_path)
-        self.processed_urls = set()
-
-    async def load_processed_urls(self):
-        async with aiosqlite.connect(self.database_path) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(
-                "SELECT link FROM articles where source = 'santiagomagazine'"
-            )
-            rows = await cursor.fetchall()
-            self.processed_urls = set(row[0] for row in rows)
-
-    async def parse_page(self, client, page_url):
-        try:
-            await self.load_processed_urls()
-
-            logger.info(f"Parsing page: {page_url}")
-            resp = await self.fetch_page(client, page_url)
-            html = Selector(text=resp.text)
-            urls = html.css("h3.title-semibold-dark a::attr(href)").getall()
-
-            logger.info(
-                f"Found {len(urls)} URLs on page {page_url}"
-            )
-
-            for url in urls:
-                url = f"https://santiagomagazine.cv{url}"
-
-                if url not in self.processed_urls:
-                    resp = await self.fetch_page(client, url)
-                    content = Selector(text=resp.text)
-                    await self.parse_article(url, content)
-                    self.processed_urls.add(url)
-                else:
-                    logger.info(f"Skipped existing URL: {url}")
-
-            next_page_link = html.css(
-                "li.page-item.active + li.page-item a::attr(href)"
-            ).get()
-            next_page_url = (
-                f"https://santiagomagazine.cv{next_page_link}"
-                if next_page_link
-                else None
-            )
-
-            if next_page_url is not None and next_page_url != page_url:
-                await self.parse_page(client, next_page_url)
-            else:
-                logger.info(f"No next page found on {page_url}")
-
-        except Exception as e:
-            logger.error(f"Error parsing page {page_url}: {e}")
-
-    async def parse_article(self, page_url, html):
-        try:
-            logger.info(f"Parsing article: {page_url}")
-            article_block = html.css("div.news-details-layout1")
-            article_publication = html.css(
-                "div.news-details-layout1 ul.post-info-dark>li>a::text"
-            ).getall()
-
-            item = {
-                "source": "santiagomagazine",
-                "title": article_block.css("h2.title-semibold-dark::text").get(),
-                "author": article_publication[-3],
-                "date_pub": normalize_date(
-                    dateparser.parse(
-                        article_publication[-1], settings={"TIMEZONE": "UTC-1"}
-                    )
-                ),
-                "link": page_url,
-                "topic": article_block.css("div.topic-box-sm::text").get(),
-                "text_html": hypertext.unescape(
-                    " <br/> ".join(
-                        article_block.css("blockquote::text,p::text").getall()
-                    )
-                ),
-            }
-
-            # Put the item into the storage queue
-            await self.storage_queue.put(item)
-
-        except Exception as e:
-            logger.error(f"Error parsing article {page_url}: {e}")
-
-
-async def main():
-    start_urls_santiago = (
+    source = "santiagomagazine"
+    default_base_url = "https://santiagomagazine.cv"
+    # Section listings the crawl starts from
+    default_start_urls = (
         "/economia",
         "/politica",
         "/cultura",
@@ -123,35 +60,38 @@ async def main():
         "/regioes",
         "/tecnologia",
     )
+    article_parser = staticmethod(parse_article_html)
 
-    # Create an async multiprocessing Queue for inter-process communication
-    storage_queue_santiago = asyncio.Queue()
+    async def parse_page(self, client, page_url, section, cursor=None):
+        logger.info(f"Parsing page: {page_url}")
+        resp = await self.fetch_page(client, page_url)
+        html = Selector(text=resp.text)
+        urls = html.css("h3.title-semibold-dark a::attr(href)").getall()
 
-    # Start the storage worker processes
-    storage_worker_santiago = StorageWorker(
-        storage_queue_santiago, "scraper_database.db"
-    )
+        logger.info(f"Found {len(urls)} URLs on page {page_url}")
 
-    storage_process_santiago = asyncio.create_task(storage_worker_santiago.run())
+        urls = [f"{self.base_url}{url}" for url in urls]
+        new_urls = await self.fetch_articles(client, urls)
+        if not self.keep_paginating(section, new_urls):
+            return
 
-    # Start the scraper processes
-    scraper_santiago = SantiagoMagazineScraper(
-        base_url="https://santiagomagazine.cv",
-        start_urls=start_urls_santiago,
-        storage_queue=storage_queue_santiago,
-        database_path="scraper_database.db",
-    )
+        next_page_link = html.css(
+            "li.page-item.active + li.page-item a::attr(href)"
+        ).get()
+        next_page_url = f"{self.base_url}{next_page_link}" if next_page_link else None
 
-    scraper_process_santiago = asyncio.create_task(scraper_santiago.run())
+        if next_page_url is not None and next_page_url != page_url:
+            self.schedule_page(next_page_url, section)
+        else:
+            logger.info(f"No next page found on {page_url}")
 
-    # Wait for the scraper processes to finish
-    await asyncio.gather(scraper_process_santiago)
 
-    # Signal the storage workers to exit
-    await storage_queue_santiago.put(SENTINEL)
+async def main(**options):
+    """Scrape this site alone. Takes the options of Orchestrator."""
+    # Imported here because the orchestrator's registry imports this module
+    from ..orchestrator import Orchestrator
 
-    # Wait for the storage worker processes to finish
-    await storage_process_santiago
+    await Orchestrator(sites=(SantiagoMagazineScraper.source,), **options).run()
 
 
 if __name__ == "__main__":
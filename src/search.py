@@ -0,0 +1,195 @@
+"""Full-text search over stored articles.
+
+articles_fts is an FTS5 index of each article's title, topic, author and body
+text, keyed by article id. Its unicode61 tokenizer folds case and diacritics,
+so "acao" finds "Ação". The index holds no copy of the text: bodies stay
+compressed in article_content, and snippets are cut from them when results are
+shown.
+
+The StorageWorker indexes new articles as it stores them. Articles stored
+before the index existed are indexed with ``python -m src.search --rebuild``.
+"""
+
+import argparse
+import html
+import json
+import re
+import sqlite3
+import unicodedata
+
+from .content import attach
+from .scraper_logger import ScraperLogger
+
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"\w+")
+QUERY_TERM_PATTERN = re.compile(r"(\w+)(\*?)")
+# FTS5 query syntax rather than search terms
+OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+
+# bm25 weights of title, topic, author and body: a match in the title counts
+# most
+WEIGHTS = (10.0, 2.0, 2.0, 1.0)
+
+INSERT_ROW = (
+    "INSERT INTO articles_fts (rowid, title, topic, author, body) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+SEARCH = f"""
+    WITH hits AS (
+        SELECT f.rowid AS id, bm25(articles_fts, {', '.join(map(str, WEIGHTS))})
+            AS score
+        FROM articles_fts f
+        JOIN articles a ON a.id = f.rowid
+        WHERE articles_fts MATCH ? AND (? IS NULL OR a.source = ?)
+        ORDER BY score
+        LIMIT ?
+    )
+    SELECT a.id, a.source, a.title, a.date_pub, a.link, a.text_html, hits.score
+    FROM hits
+    JOIN articles_full a ON a.id = hits.id
+    ORDER BY hits.score
+"""
+
+
+def plain_text(text):
+    """Body text without markup, as it is indexed."""
+    if text is None:
+        return None
+    return " ".join(html.unescape(TAG_PATTERN.sub(" ", text)).split())
+
+
+def fold(word):
+    # What remove_diacritics does to a token: "Ação" and "acao" compare equal
+    return unicodedata.normalize("NFKD", word.lower()).encode("ascii", "ignore")
+
+
+def query_terms(query):
+    """(folded term, is_prefix) for each search term of an FTS5 query."""
+    return [
+        (fold(word), bool(star))
+        for word, star in QUERY_TERM_PATTERN.findall(query)
+        if word not in OPERATORS
+    ]
+
+
+def snippet(text, terms, words=24, start="[", end="]"):
+    """A window of about `words` words of text around the first match of the
+    terms, with every match wrapped in start and end."""
+    matches = list(WORD_PATTERN.finditer(text))
+    if not matches:
+        return ""
+
+    def matched(match):
+        word = fold(match.group())
+        return any(
+            word.startswith(term) if prefix else word == term for term, prefix in terms
+        )
+
+    first = next((i for i, match in enumerate(matches) if matched(match)), 0)
+    low = max(first - words // 3, 0)
+    high = min(low + words, len(matches))
+    window = matches[low:high]
+
+    parts, position = [], window[0].start()
+    for match in window:
+        parts.append(text[position : match.start()])
+        parts.append(
+            f"{start}{match.group()}{end}" if matched(match) else match.group()
+        )
+        position = match.end()
+    before = "…" if low > 0 else ""
+    after = "…" if high < len(matches) else ""
+    return before + "".join(parts) + after
+
+
+def search(conn, query, limit=20, source=None):
+    """Articles matching an FTS5 query, best first, as dicts with a snippet of
+    their body (or title) around the first match."""
+    attach(conn)
+    terms = query_terms(query)
+    results = []
+    for article_id, source_, title, date_pub, link, text, score in conn.execute(
+        SEARCH, (query, source, source, limit)
+    ):
+        results.append(
+            {
+                "id": article_id,
+                "source": source_,
+                "title": title,
+                "date_pub": date_pub,
+                "link": link,
+                "score": score,
+                "snippet": snippet(plain_text(text) or title or "", terms),
+            }
+        )
+    return results
+
+
+def rebuild(conn, chunk_size=500):
+    """Index every stored article again, replacing the whole index at once."""
+    attach(conn)
+    conn.execute("INSERT INTO articles_fts (articles_fts) VALUES ('delete-all')")
+    last_id, indexed = 0, 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, title, topic, author, text_html FROM articles_full "
+            "WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            break
+        conn.executemany(
+            INSERT_ROW,
+            [
+                (article_id, title, topic, author, plain_text(text))
+                for article_id, title, topic, author, text in rows
+            ],
+        )
+        last_id = rows[-1][0]
+        indexed += len(rows)
+    # One transaction, so searches keep using the old index until it is done
+    conn.commit()
+    ScraperLogger.log_info(f"Indexed {indexed} articles")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search stored articles.")
+    parser.add_argument(
+        "query",
+        nargs="?",
+        help='FTS5 query, e.g. governo, "sao vicente", eleic* OR autarquicas',
+    )
+    parser.add_argument("--database", default="scraper_database.db")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--source", default=None, help="only search this site")
+    parser.add_argument(
+        "--json", action="store_true", help="print the results as JSON lines"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="index every stored article again (e.g. ones stored before the "
+        "index existed)",
+    )
+    args = parser.parse_args()
+    if args.query is None and not args.rebuild:
+        parser.error("a query or --rebuild is required")
+
+    with sqlite3.connect(args.database) as conn:
+        if args.rebuild:
+            rebuild(conn)
+        if args.query is not None:
+            try:
+                results = search(conn, args.query, args.limit, args.source)
+            except sqlite3.OperationalError as e:
+                parser.error(f"invalid query: {e}")
+            for result in results:
+                if args.json:
+                    print(json.dumps(result, ensure_ascii=False))
+                else:
+                    print(
+                        f"{result['title']} ({result['source']}, {result['date_pub']})"
+                    )
+                    print(f"  {result['link']}")
+                    print(f"  {result['snippet']}\n")
@@ -1,82 +1,483 @@
-from queue import Empty
+import asyncio
+import json
+import time
 
 import aiosqlite
 from rich.console import Console
 
+from .content import attach_async
+from .dedup import FIND_CANDIDATES, find_duplicate, fingerprint
+from .metrics import (
+    BATCH_SECONDS,
+    BODY_BYTES,
+    DUPLICATES,
+    QUEUE_DEPTH,
+    ROWS_WRITTEN,
+)
+from .search import INSERT_ROW, plain_text
+
 SENTINEL = "STOP"
 
 console = Console()
 
+# Each script upgrades the schema by one version. PRAGMA user_version records how
+# many of them a database file has already applied.
+MIGRATIONS = (
+    # 1: drop duplicate links (keeping the oldest row), then make link unique so
+    # saves can rely on INSERT OR IGNORE, and index the per-source loads
+    """
+    DELETE FROM articles
+    WHERE id NOT IN (SELECT MIN(id) FROM articles GROUP BY link);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_articles_link ON articles (link);
+    CREATE INDEX IF NOT EXISTS idx_articles_source_date
+        ON articles (source, date_pub);
+    """,
+    # 2: where each section's crawl goes on, so a backfill can resume
+    """
+    CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+        source TEXT NOT NULL,
+        section TEXT NOT NULL,
+        page_url TEXT,
+        cursor TEXT,
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY (source, section)
+    );
+    """,
+    # 3: compressed bodies apart from the metadata (see src/content.py)
+    """
+    CREATE TABLE IF NOT EXISTS article_content (
+        article_id INTEGER PRIMARY KEY REFERENCES articles (id),
+        codec TEXT NOT NULL,
+        body BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS compression_dictionaries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        codec TEXT NOT NULL,
+        data BLOB NOT NULL,
+        created_at TEXT
+    );
+    """,
+    # 4: body fingerprints for near-duplicate detection (see src/dedup.py)
+    """
+    CREATE TABLE IF NOT EXISTS article_fingerprints (
+        article_id INTEGER PRIMARY KEY REFERENCES articles (id),
+        content_hash INTEGER NOT NULL,
+        simhash INTEGER NOT NULL,
+        band0 INTEGER NOT NULL,
+        band1 INTEGER NOT NULL,
+        band2 INTEGER NOT NULL,
+        band3 INTEGER NOT NULL,
+        duplicate_of INTEGER REFERENCES articles (id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_content_hash
+        ON article_fingerprints (content_hash);
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_band0 ON article_fingerprints (band0);
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_band1 ON article_fingerprints (band1);
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_band2 ON article_fingerprints (band2);
+    CREATE INDEX IF NOT EXISTS idx_fingerprints_band3 ON article_fingerprints (band3);
+    """,
+    # 5: full-text index of titles, topics, authors and bodies (see src/search.py).
+    # It keeps no copy of the text, and indexes prefixes for queries like eleic*
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5 (
+        title, topic, author, body,
+        content = '',
+        prefix = '2 3',
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """,
+)
+
+# First schema version with bodies in article_content
+CONTENT_VERSION = 3
+
 
 class StorageWorker:
-    def __init__(self, storage_queue, database_path):
+    def __init__(
+        self,
+        storage_queue,
+        database_path,
+        batch_size=200,
+        flush_interval=2.0,
+        body_codec=None,
+        dedup="flag",
+        upsert=False,
+        job_table=None,
+    ):
         self.storage_queue = storage_queue
         self.database_path = database_path
+        # A batch is flushed when it reaches batch_size items or when its oldest
+        # item has waited flush_interval seconds, whichever comes first
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # "zstd" or "zlib" for article bodies; None prefers zstd when installed
+        self.body_codec_name = body_codec
+        self.body_codec = None
+        # Near-duplicate bodies: "flag" records the article they duplicate,
+        # "skip" also leaves their body unstored, "off" does neither
+        if dedup not in ("off", "flag", "skip"):
+            raise ValueError(f"Unknown dedup mode: {dedup}")
+        self.dedup = dedup
+        # Articles already stored are replaced instead of skipped (for
+        # reparsing). The search index of replaced articles is left as it
+        # was, to be rebuilt afterwards.
+        self.upsert = upsert
+        # Article jobs of a shared JobTable are marked done once their article
+        # is committed, so a runner that dies with articles still queued leaves
+        # their jobs to be retried
+        self.job_table = job_table
+        self.conn = None
+        # Set once the schema is in place, for scrapers that read the database
+        self.ready = asyncio.Event()
 
     async def run(self):
-        # Initialize SQLite database and table
-        await self.init_database()
+        # Runners sharing a job table may share the database too, and wait for
+        # each other's write transactions
+        async with aiosqlite.connect(self.database_path, timeout=30) as conn:
+            self.conn = conn
+            # Initialize SQLite database and table
+            await self.init_database()
+            self.ready.set()
+
+            batch = []
+            deadline = None
 
-        while True:
             try:
-                item = await self.storage_queue.get()
-                if item == SENTINEL:
-                    break
-
-                if not await self.article_exists(item["link"]):
-                    await self.save_to_storage(item)
-                else:
-                    console.print(f"[yellow]Skipped existing article:[/yellow] {item}")
-            except Empty:
-                pass
-
-    async def article_exists(self, link):
-        async with aiosqlite.connect(self.database_path) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(
-                "SELECT COUNT(*) FROM articles WHERE link = ?", (link,)
-            )
-            count = await cursor.fetchone()
-            return count[0] > 0
+                while True:
+                    timeout = None
+                    if deadline is not None:
+                        timeout = max(deadline - time.monotonic(), 0)
+
+                    try:
+                        item = await asyncio.wait_for(self.storage_queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        await self.flush(batch)
+                        batch, deadline = [], None
+                        continue
+
+                    QUEUE_DEPTH.set(self.storage_queue.qsize())
+                    if item == SENTINEL:
+                        break
+
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                    if len(batch) >= self.batch_size:
+                        await self.flush(batch)
+                        batch, deadline = [], None
+            finally:
+                # Also reached when the worker is cancelled, so the items it
+                # already took off the queue are not lost
+                await self.flush(batch)
+
+        self.conn = None
 
     async def init_database(self):
-        async with aiosqlite.connect(self.database_path) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS articles (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    source TEXT,
-                    title TEXT,
-                    author TEXT,
-                    date_pub TEXT,
-                    link TEXT,
-                    topic TEXT,
-                    text_html TEXT
-                )
+        await self.conn.execute("PRAGMA journal_mode=WAL")
+        await self.conn.execute("PRAGMA synchronous=NORMAL")
+        await self.conn.execute(
             """
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                title TEXT,
+                author TEXT,
+                date_pub TEXT,
+                link TEXT,
+                topic TEXT,
+                text_html TEXT
+            )
+        """
+        )
+        await self.conn.commit()
+        version = await self.migrate()
+        self.body_codec = await attach_async(self.conn, self.body_codec_name)
+        if version < CONTENT_VERSION:
+            await self.move_inline_bodies()
+
+    async def schema_version(self):
+        async with self.conn.execute("PRAGMA user_version") as cursor:
+            (version,) = await cursor.fetchone()
+        return version
+
+    async def migrate(self):
+        """Apply pending migrations and return the version the file was at."""
+        version = start = await self.schema_version()
+        while version < len(MIGRATIONS):
+            number = version + 1
+            console.print(f"[blue]Migrating database to schema version {number}[/blue]")
+            try:
+                # executescript commits anything pending first, so each
+                # migration and its version bump land atomically in their own
+                # transaction
+                await self.conn.executescript(
+                    f"BEGIN IMMEDIATE; {MIGRATIONS[version]}; "
+                    f"PRAGMA user_version = {number}; COMMIT;"
+                )
+            except aiosqlite.OperationalError:
+                await self.conn.rollback()
+                # Another runner on the same database may have applied it
+                # while this one waited for the write lock
+                version = await self.schema_version()
+                if version < number:
+                    raise
+                continue
+            version = number
+        return start
+
+    async def move_inline_bodies(self, chunk_size=500):
+        """Compress the bodies stored inline in articles into article_content."""
+        last_id, moved = 0, 0
+        while True:
+            async with self.conn.execute(
+                "SELECT id, text_html FROM articles "
+                "WHERE id > ? AND text_html IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, chunk_size),
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                break
+
+            bodies = await asyncio.to_thread(
+                self.compress_bodies, [text for _, text in rows]
+            )
+            await self.conn.executemany(
+                "INSERT OR REPLACE INTO article_content (article_id, codec, body) "
+                "VALUES (?, ?, ?)",
+                [(article_id, *body) for (article_id, _), body in zip(rows, bodies)],
+            )
+            await self.conn.executemany(
+                "UPDATE articles SET text_html = NULL WHERE id = ?",
+                [(article_id,) for article_id, _ in rows],
             )
-            await conn.commit()
-
-    async def save_to_storage(self, item):
-        async with aiosqlite.connect(self.database_path) as conn:
-            cursor = await conn.cursor()
-            await cursor.execute(
-                """
-                INSERT INTO articles
-                (source, title, author, date_pub, link, topic, text_html)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
+            await self.conn.commit()
+            last_id = rows[-1][0]
+            moved += len(rows)
+
+        if moved:
+            console.print(
+                f"[blue]Compressed {moved} article bodies into article_content; "
+                "VACUUM the database to reclaim the space[/blue]"
+            )
+
+    def compress_bodies(self, texts):
+        """(codec, blob) for each body, or (None, None) for a missing one.
+        Runs in a thread to keep compression off the event loop."""
+        bodies = []
+        for text in texts:
+            if text is None:
+                bodies.append((None, None))
+                continue
+            codec, blob = self.body_codec.compress(text)
+            BODY_BYTES.inc(len(text.encode("utf-8")), stage="raw")
+            BODY_BYTES.inc(len(blob), stage="compressed")
+            bodies.append((codec, blob))
+        return bodies
+
+    async def flush(self, batch):
+        if not batch:
+            return
+
+        # Only the latest checkpoint of each section matters
+        checkpoints = {
+            (item["source"], item["section"]): (
+                item["source"],
+                item["section"],
+                item["page_url"],
+                item["cursor"],
+                item["done"],
+            )
+            for item in batch
+            if item.get("type") == "checkpoint"
+        }
+        jobs = [
+            (item["job_id"], item["owner"])
+            for item in batch
+            if item.get("type") == "job"
+        ]
+        # A link queued twice in the batch (e.g. reached from two sections) is
+        # written once, from its last copy, so its metadata and body match
+        articles = list(
+            {
+                item["link"]: item
+                for item in batch
+                if item.get("type") not in ("checkpoint", "job")
+            }.values()
+        )
+        rows = [
+            (
+                item["source"],
+                item["title"],
+                item["author"],
+                item["date_pub"],
+                item["link"],
+                item["topic"],
+            )
+            for item in articles
+        ]
+        texts = [item["text_html"] for item in articles]
+        bodies = await asyncio.to_thread(self.compress_bodies, texts)
+        documents = await asyncio.to_thread(lambda: list(map(plain_text, texts)))
+        fingerprints = []
+        if self.dedup != "off":
+            # Scrapers fingerprint bodies in their parse executor; the rest are
+            # done here
+            fingerprints = await asyncio.to_thread(
+                lambda: [
+                    item["fingerprint"] if "fingerprint" in item else fingerprint(text)
+                    for item, text in zip(articles, texts)
+                ]
+            )
+        await self.save_to_storage(
+            rows, bodies, list(checkpoints.values()), fingerprints, documents
+        )
+        if jobs and self.job_table is not None:
+            completed = await self.job_table.complete(jobs)
+            if completed < len(jobs):
+                console.print(
+                    f"[yellow]{len(jobs) - completed} article jobs were leased again "
+                    "by other runners before their articles were stored[/yellow]"
+                )
+
+    async def article_ids(self, links):
+        async with self.conn.execute(
+            "SELECT a.link, a.id FROM articles a "
+            "JOIN json_each(?) j ON a.link = j.value",
+            (json.dumps(links),),
+        ) as cursor:
+            return dict(await cursor.fetchall())
+
+    async def save_to_storage(
+        self, rows, bodies=(), checkpoints=(), fingerprints=(), documents=()
+    ):
+        # One transaction per batch: a single commit (and fsync) for all rows.
+        # Links already stored are skipped by the unique index on link.
+        # Checkpoints commit along with the articles queued before them.
+        started = time.monotonic()
+        links = [row[4] for row in rows]
+        stored = await self.article_ids(links) if links else {}
+        changes_before = self.conn.total_changes
+        await self.conn.executemany(
+            """
+            INSERT OR IGNORE INTO articles
+            (source, title, author, date_pub, link, topic)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+        saved = self.conn.total_changes - changes_before
+
+        # Bodies and fingerprints are keyed by the id each new link got;
+        # articles stored before keep theirs
+        ids = await self.article_ids(links) if links else {}
+        new_ids = {link: ids[link] for link in links if link not in stored}
+        written_ids = dict(new_ids)
+        if self.upsert and stored:
+            written_ids.update(await self.replace_articles(rows, stored))
+        duplicates = await self.find_duplicates(links, written_ids, fingerprints)
+        skipped = duplicates if self.dedup == "skip" else set()
+        await self.conn.executemany(
+            "INSERT OR REPLACE INTO article_content (article_id, codec, body) "
+            "VALUES (?, ?, ?)",
+            [
+                (written_ids[link], codec, blob)
+                for link, (codec, blob) in zip(links, bodies)
+                if blob is not None
+                and link in written_ids
+                and written_ids[link] not in skipped
+            ],
+        )
+        await self.conn.executemany(
+            "DELETE FROM article_content WHERE article_id = ?",
+            [(article_id,) for article_id in skipped if article_id not in new_ids],
+        )
+        # New articles are searchable as soon as they are committed; a skipped
+        # duplicate is indexed without the body it no longer has
+        await self.conn.executemany(
+            INSERT_ROW,
+            [
                 (
-                    item["source"],
-                    item["title"],
-                    item["author"],
-                    item["date_pub"],
-                    item["link"],
-                    item["topic"],
-                    item["text_html"],
-                ),
+                    new_ids[link],
+                    row[1],
+                    row[5],
+                    row[2],
+                    None if new_ids[link] in skipped else document,
+                )
+                for row, link, document in zip(rows, links, documents)
+                if link in new_ids
+            ],
+        )
+        await self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO crawl_checkpoints
+            (source, section, page_url, cursor, done, updated_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+        """,
+            checkpoints,
+        )
+        await self.conn.commit()
+
+        BATCH_SECONDS.observe(time.monotonic() - started)
+        ROWS_WRITTEN.inc(saved, result="inserted")
+        ROWS_WRITTEN.inc(
+            len(rows) - saved, result="updated" if self.upsert else "ignored"
+        )
+        if not rows:
+            return
+        console.print(f"[green]Saved {saved} items to SQLite database[/green]")
+        if saved < len(rows):
+            console.print(
+                f"[yellow]{'Updated' if self.upsert else 'Skipped'} "
+                f"{len(rows) - saved} existing articles[/yellow]"
             )
-            await conn.commit()
+        if duplicates:
+            console.print(
+                f"[yellow]{'Skipped' if self.dedup == 'skip' else 'Flagged'} "
+                f"{len(duplicates)} duplicate article bodies[/yellow]"
+            )
+
+    async def replace_articles(self, rows, stored):
+        """Overwrite the metadata of the stored articles among rows, and drop
+        their fingerprints to be computed again. Returns their ids by link."""
+        replaced = {row[4]: stored[row[4]] for row in rows if row[4] in stored}
+        await self.conn.executemany(
+            "UPDATE articles SET source = ?, title = ?, author = ?, date_pub = ?, "
+            "topic = ?, text_html = NULL WHERE link = ?",
+            [(*row[:4], row[5], row[4]) for row in rows if row[4] in stored],
+        )
+        await self.conn.executemany(
+            "DELETE FROM article_fingerprints WHERE article_id = ?",
+            [(article_id,) for article_id in replaced.values()],
+        )
+        return replaced
+
+    async def find_duplicates(self, links, new_ids, fingerprints):
+        """Fingerprint the new articles and return the ids of those whose body
+        duplicates one already stored (or earlier in the batch)."""
+        duplicates, seen = set(), set()
+        for link, result in zip(links, fingerprints):
+            article_id = new_ids.get(link)
+            # A link listed twice in the batch is fingerprinted once
+            if article_id is None or result is None or article_id in seen:
+                continue
+            seen.add(article_id)
 
-        console.print(f"[green]Saved item to SQLite database:[/green] {item}")
+            content_hash, value, bands = result
+            async with self.conn.execute(
+                FIND_CANDIDATES, (content_hash, *bands)
+            ) as cursor:
+                duplicate = find_duplicate(
+                    await cursor.fetchall(), content_hash, value, article_id
+                )
+            await self.conn.execute(
+                "INSERT OR IGNORE INTO article_fingerprints "
+                "(article_id, content_hash, simhash, band0, band1, band2, band3, "
+                "duplicate_of) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (article_id, content_hash, value, *bands, duplicate and duplicate[0]),
+            )
+            if duplicate is not None:
+                duplicates.add(article_id)
+                DUPLICATES.inc(kind=duplicate[1])
+        return duplicates
@@ -0,0 +1,72 @@
+import math
+from hashlib import blake2b
+
+
+def url_id(url):
+    """Return a stable 64-bit id for url."""
+    return int.from_bytes(blake2b(url.encode(), digest_size=8).digest(), "big")
+
+
+class HashedUrlSet:
+    """Set of URLs kept as 64-bit ids instead of full strings.
+
+    Two different URLs colliding on the same id is possible but, at 64 bits,
+    negligible for archives of millions of articles.
+    """
+
+    def __init__(self, urls=()):
+        self.ids = set()
+        self.update(urls)
+
+    def __contains__(self, url):
+        return url_id(url) in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, url):
+        self.ids.add(url_id(url))
+
+    def discard(self, url):
+        self.ids.discard(url_id(url))
+
+    def update(self, urls):
+        self.ids.update(url_id(url) for url in urls)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over URLs.
+
+    Membership answers are either "definitely not added" or "probably added",
+    with a false positive rate close to error_rate while at most capacity URLs
+    have been added. Callers are expected to confirm positive answers.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, url):
+        digest = blake2b(url.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def __contains__(self, url):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(url))
+
+    def __len__(self):
+        return self.count
+
+    def add(self, url):
+        for p in self.positions(url):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
@@ -0,0 +1,66 @@
+"""User-Agent strings the scrapers send.
+
+The pool is bundled in user_agents.json and read once per process, instead of
+every scraper loading fake_useragent's browser database at startup. Refresh
+it from an up-to-date fake_useragent with ``python -m src.user_agents
+--refresh``.
+"""
+
+import argparse
+import functools
+import json
+import os
+
+POOL_PATH = os.path.join(os.path.dirname(__file__), "user_agents.json")
+BROWSERS = ("Chrome", "Firefox", "Edge")
+
+
+@functools.lru_cache(maxsize=None)
+def user_agents():
+    with open(POOL_PATH) as f:
+        return tuple(json.load(f))
+
+
+def refresh(per_browser=10):
+    """Rewrite the pool with the most used desktop versions of BROWSERS."""
+    # Only needed here, and slow to load
+    from fake_useragent import UserAgent
+
+    entries = sorted(
+        (
+            entry
+            for entry in UserAgent().data_browsers
+            if entry["browser"] in BROWSERS and entry["type"] == "desktop"
+        ),
+        key=lambda entry: entry["percent"],
+        reverse=True,
+    )
+    pool = []
+    for browser in BROWSERS:
+        # dict.fromkeys drops repeated strings and keeps the most used first
+        strings = dict.fromkeys(
+            entry["useragent"] for entry in entries if entry["browser"] == browser
+        )
+        pool.extend(list(strings)[:per_browser])
+
+    with open(POOL_PATH, "w") as f:
+        json.dump(pool, f, indent=2)
+        f.write("\n")
+    user_agents.cache_clear()
+    return pool
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the User-Agent pool.")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="rebuild the bundled pool from fake_useragent's browser data",
+    )
+    parser.add_argument(
+        "--per-browser", type=int, default=10, help="User-Agents kept per browser"
+    )
+    args = parser.parse_args()
+
+    pool = refresh(args.per_browser) if args.refresh else user_agents()
+    print("\n".join(pool))
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+import pytest
+
+from src.date_parser import parse_date, stats
+
+# Dates as each site writes them, and what they must be stored as. Numeric
+# dates are day-first on every site: 10/11/2023 is 10 November.
+LAYOUTS = [
+    ("anacao", "17 de outubro de 2023", datetime(2023, 10, 17)),
+    ("anacao", "1 de março de 2024", datetime(2024, 3, 1)),
+    ("anacao", "Terça-feira, 17 de Outubro de 2023", datetime(2023, 10, 17)),
+    ("anacao", "outubro 17, 2023", datetime(2023, 10, 17)),
+    ("anacao", "10/11/2023", datetime(2023, 11, 10)),
+    ("santiagomagazine", "10/11/2023 14:35", datetime(2023, 11, 10, 14, 35)),
+    ("santiagomagazine", "05/06/2024", datetime(2024, 6, 5)),
+    ("santiagomagazine", "17 de outubro de 2023", datetime(2023, 10, 17)),
+    ("expressodasilhas", "17 out 2023, 10:30", datetime(2023, 10, 17, 10, 30)),
+    ("expressodasilhas", "3 Fev. 2024, 08:05", datetime(2024, 2, 3, 8, 5)),
+    ("expressodasilhas", "10.11.2023 - 9h15", datetime(2023, 11, 10, 9, 15)),
+    ("expressodasilhas", "2023-10-17T10:30:00", datetime(2023, 10, 17, 10, 30)),
+]
+
+
+@pytest.mark.parametrize("source, text, expected", LAYOUTS)
+def test_site_layouts(source, text, expected):
+    fallbacks = stats["fallback"] + stats["failed"]
+    assert parse_date(text, source) == expected
+    # Matched by a fast-path layout, not left to dateparser
+    assert stats["fallback"] + stats["failed"] == fallbacks